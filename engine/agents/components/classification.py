@@ -310,7 +310,7 @@ class ClassificationComponent(BaseComponent):
             logger.debug("🔬 Invoking CNN model for classification...")
             
             # Call the improved CNN model
-            for chunk in self.cnn_model.predict_leaf_classification(image_b64, context_text):
+            async for chunk in self.cnn_model.apredict_leaf_classification(image_b64, context_text):
                 chunk_str = str(chunk).rstrip("\n")
                 
                 # Handle attention visualization chunks
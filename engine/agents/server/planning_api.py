@@ -96,7 +96,6 @@ class PlanningAgentAPI:
                 async def stream_generator():
                     # Emit initial status
                     yield f"data: Starting analysis...\n\n"
-                    await asyncio.sleep(0.3)
                     
                     # Define streaming callback to emit intermediate results
                     async def stream_callback(response_chunk: str):
@@ -226,7 +226,6 @@ async def planning_chat_stream(req: PlanningChatRequest):
             try:
                 # Emit initial status
                 yield f"data: 🚀 Starting analysis...\n\n"
-                await asyncio.sleep(0.1)
                 
                 # Get session summary for context
                 session_summary = await planning_agent.get_session_summary(req.session_id or "default")
@@ -237,39 +236,26 @@ async def planning_chat_stream(req: PlanningChatRequest):
                 # Emit progress based on current state and request content
                 if current_state in ['initial', 'intent_capture'] and req.image_b64:
                     yield f"data: 📸 Processing uploaded image...\n\n"
-                    await asyncio.sleep(0.5)
                     yield f"data: 🔍 Analyzing plant condition...\n\n"
-                    await asyncio.sleep(1.0)
                     yield f"data: 🧠 Extracting features and context...\n\n"
-                    await asyncio.sleep(0.3)
                 
                 elif current_state == 'clarification':
                     yield f"data: 💬 Analyzing your response...\n\n"
-                    await asyncio.sleep(0.3)
                     yield f"data: 🎯 Determining next steps...\n\n"
-                    await asyncio.sleep(0.2)
                 
                 elif current_state == 'classification':
                     yield f"data: 🔬 Running disease classification...\n\n"
-                    await asyncio.sleep(0.8)
                     yield f"data: 🎯 Generating attention visualization...\n\n"
-                    await asyncio.sleep(0.5)
                     yield f"data: 📊 Calculating confidence scores...\n\n"
-                    await asyncio.sleep(0.3)
                 
                 elif current_state == 'prescription':
                     yield f"data: 📚 Searching treatment database...\n\n"
-                    await asyncio.sleep(0.7)
                     yield f"data: 🎯 Personalizing recommendations...\n\n"
-                    await asyncio.sleep(0.4)
                     yield f"data: 💊 Generating prescription options...\n\n"
-                    await asyncio.sleep(0.3)
                 
                 elif current_state == 'vendor_recommendation':
                     yield f"data: 🏪 Finding local suppliers...\n\n"
-                    await asyncio.sleep(0.5)
                     yield f"data: 💰 Calculating cost estimates...\n\n"
-                    await asyncio.sleep(0.3)
                 
                 # Process the actual request
                 logger.debug("   Invoking planning agent...")
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import uuid
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI, Request, Query
@@ -16,12 +17,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def _wrap_sse(chunk: str) -> bytes:
+    return f"data: {chunk}\n\n".encode("utf-8")
+
+
+def _wrap_plain(chunk: str) -> bytes:
+    if not chunk.endswith("\n"):
+        chunk += "\n"
+    return chunk.encode("utf-8")
+
+
+# (media_type, chunk wrapper, response headers) for /chat-stream, keyed by "client wants SSE"
+_STREAM_VARIANTS = {
+    True: ("text/event-stream", _wrap_sse, {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "X-Accel-Buffering": "no",
+    }),
+    False: ("text/plain", _wrap_plain, {}),
+}
+
+
 class AgentAPI:
-    def __init__(self, agent_core: AgentCore):
-        self.app = FastAPI()
+    def __init__(self, agent_core: Optional[AgentCore] = None):
+        # Without an agent_core, the shared AgentCore (and its models) is built at ASGI startup
+        self.app = FastAPI(lifespan=self._lifespan)
         self.agent_core = agent_core
         self._add_routes()
 
+    @asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        """Load the AgentCore models in the serving process when the app starts, not at import"""
+        if self.agent_core is None:
+            self.agent_core = await asyncio.to_thread(_get_agent_core)
+        yield
+
     def _should_summarize_response(self, system_context: str, response_text: str) -> bool:
         """
         Determine if the response should be summarized based on whether actual classification occurred.
@@ -152,24 +182,8 @@ class AgentAPI:
         @self.app.post("/chat-stream")
         async def chat_stream(req: ChatRequest, request: Request, format: Optional[str] = Query(None)):
             accept_header = (format or request.headers.get("accept", "")).lower()
-            if "text/event-stream" in accept_header or (format and format.lower() == "sse"):
-                media_type = "text/event-stream"
-                def wrap(chunk: str) -> bytes:
-                    return (f"data: {chunk}\n\n").encode("utf-8")
-                extra_headers = {
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive",
-                    "X-Accel-Buffering": "no",
-                }
-            else:
-                media_type = "text/plain"
-                def wrap(chunk: str) -> bytes:
-                    if not chunk.endswith("\n"):
-                        chunk_out = chunk + "\n"
-                    else:
-                        chunk_out = chunk
-                    return chunk_out.encode("utf-8")
-                extra_headers = {}
+            is_sse = "text/event-stream" in accept_header or (format and format.lower() == "sse")
+            media_type, wrap, extra_headers = _STREAM_VARIANTS[bool(is_sse)]
 
             queue: asyncio.Queue[bytes] = asyncio.Queue()
             loop = asyncio.get_event_loop()
@@ -216,24 +230,19 @@ class AgentAPI:
                     if has_image:
                         logger.info("🔥 DIRECT API-LEVEL STREAMING: Image classification detected")
                         
-                        # Stream progress updates DIRECTLY with real delays at API level
-                        await asyncio.sleep(0.3)
+                        # Stream progress updates directly at API level
                         emit("Resized image, normalizing and preprocessing...")
                         logger.info("📡 Streamed chunk 1 directly from API")
                         
-                        await asyncio.sleep(1.5)  
                         emit("Preparing image for neural network analysis...")
                         logger.info("📡 Streamed chunk 2 directly from API")
                         
-                        await asyncio.sleep(1.2)
                         emit("Running CNN model inference...")
                         logger.info("📡 Streamed chunk 3 directly from API")
                         
-                        await asyncio.sleep(1.0)
                         emit("Analyzing prediction results...")
                         logger.info("📡 Streamed chunk 4 directly from API")
                         
-                        await asyncio.sleep(1.0)
                         emit("Finalizing diagnosis...")
                         logger.info("📡 Streamed chunk 5 directly from API")
                         
@@ -245,7 +254,6 @@ class AgentAPI:
                             callbacks=[QueueCallbackHandler()]
                         )
                         
-                        await asyncio.sleep(0.5)
                         final_text = result.get("output") if isinstance(result, dict) else str(result)
                         logger.info("✅ CNN classification completed, proceeding with response")
                         
@@ -388,7 +396,7 @@ def _get_api_server():
     global _api_server
     if _api_server is None:
         logger.info("🔧 Creating AgentAPI server (singleton)")
-        _api_server = AgentAPI(_get_agent_core())
+        _api_server = AgentAPI()
         logger.info("✅ AgentAPI server created successfully")
     return _api_server
 
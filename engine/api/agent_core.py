@@ -974,7 +974,7 @@ class AgentCore:
             # Do actual CNN prediction directly without progress streaming
             logger.info("🧠 Running CNN prediction...")
             prediction_chunks = []
-            for chunk in self.model.predict_leaf_classification(image_b64, user_input):
+            async for chunk in self.model.apredict_leaf_classification(image_b64, user_input):
                 chunk_str = str(chunk).rstrip("\n")
                 
                 # Handle attention visualization chunks specially
@@ -1402,7 +1402,7 @@ class AgentCore:
         outputs = []
         
         try:
-            for chunk in self.model.predict_leaf_classification(image_b64, user_input or ""):
+            async for chunk in self.model.apredict_leaf_classification(image_b64, user_input or ""):
                 chunk_str = str(chunk).rstrip("\n")
                 
                 # Handle attention visualization chunks specially
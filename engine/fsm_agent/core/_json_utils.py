@@ -0,0 +1,54 @@
+"""
+JSON helpers for FSM Agent state persistence
+
+Uses orjson when it is installed and falls back to the standard library
+json module otherwise. Both paths return/accept bytes and serialize
+datetimes as ISO-8601 strings, so callers don't need to pre-walk the data.
+"""
+
+import json
+from datetime import date, datetime
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """Fallback serializer for values the encoder doesn't handle natively"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, "tolist"):  # numpy arrays and scalars
+        return obj.tolist()
+    return str(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        """Serialize obj to JSON bytes"""
+        option = _ORJSON_OPTIONS | orjson.OPT_INDENT_2 if indent else _ORJSON_OPTIONS
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Deserialize JSON from bytes or str"""
+        return orjson.loads(data)
+
+else:
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        """Serialize obj to JSON bytes"""
+        if indent:
+            return json.dumps(obj, indent=2, default=_default).encode("utf-8")
+        return json.dumps(obj, separators=(",", ":"), default=_default).encode("utf-8")
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Deserialize JSON from bytes or str"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+JSONDecodeError = json.JSONDecodeError
@@ -167,10 +167,8 @@ class DynamicPlanningAgent:
             True if session exists, False otherwise
         """
         try:
-            # Try to get the session file path and check if it exists
-            import os
-            session_file_path = session_manager._get_session_file(session_id)
-            return os.path.exists(session_file_path)
+            # Snapshots are written in the background, so ask the manager rather than the filesystem
+            return session_manager.session_exists(session_id)
         except Exception as e:
             logger.error(f"Error checking session existence: {str(e)}")
             return False
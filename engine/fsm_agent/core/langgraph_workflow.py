@@ -382,7 +382,9 @@ class DynamicPlanningWorkflow:
         """
         try:
             # Get or create workflow state with session persistence
-            state = self.session_manager.get_or_create_state(session_id, user_message, user_image, context)
+            state = await asyncio.to_thread(
+                self.session_manager.get_or_create_state, session_id, user_message, user_image, context
+            )
             
             # Run workflow
             result = await self.app.ainvoke(state)
@@ -426,7 +428,9 @@ class DynamicPlanningWorkflow:
         """
         try:
             # Get or create workflow state with session persistence
-            state = self.session_manager.get_or_create_state(session_id, user_message, user_image, context)
+            state = await asyncio.to_thread(
+                self.session_manager.get_or_create_state, session_id, user_message, user_image, context
+            )
             
             logger.info(f"Starting refactored workflow stream for session {session_id} with message: {user_message[:50]}...")
             if user_image:
@@ -3,8 +3,19 @@ Initial Node for FSM Agent workflow
 Handles user input and determines first action based on user intent
 """
 
+import asyncio
+import itertools
+import json
 import logging
-from typing import Dict, Any, Optional
+import re
+from collections import ChainMap
+from typing import Dict, Any, NamedTuple, Optional, Tuple
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 from .base_node import BaseNode
 
@@ -17,10 +28,128 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Upper bound (seconds) on the streamed LLM intent analysis before falling back to keywords
+INTENT_ANALYSIS_TIMEOUT = 60.0
+
+# Context fields the extractor may fill in when the API request did not provide them
+_CONTEXT_FIELDS = ("location", "season", "plant_type", "growth_stage")
+
+
+class Intent(NamedTuple):
+    """User intent as analyzed by the LLM (or the keyword fallback)"""
+    wants_classification: bool = False
+    wants_prescription: bool = False
+    wants_vendors: bool = False
+    wants_full_workflow: bool = False
+    is_general_question: bool = False
+    general_answer: str = ""
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Intent":
+        """Build an Intent from a (possibly partial) dict, ignoring unknown keys"""
+        return cls(**{field: data[field] for field in cls._fields if field in data})
+
+
+# Keyword sets for the fallback (non-LLM) intent analysis
+_CLASSIFICATION_KEYWORDS = frozenset({"analyze", "detect", "identify", "classify", "disease", "what", "wrong", "issue", "problem"})
+_PRESCRIPTION_KEYWORDS = frozenset({"treatment", "cure", "fix", "help", "recommend", "prescription", "medicine", "spray"})
+_VENDOR_KEYWORDS = frozenset({"buy", "purchase", "order", "vendor", "shop", "price", "cost"})
+_FULL_WORKFLOW_KEYWORDS = frozenset({"complete", "full", "everything", "all", "comprehensive"})
+_GENERAL_KEYWORDS = frozenset({"how", "when", "why", "what", "where", "best time", "tips", "advice", "weather", "climate"})
+_FARMING_KEYWORDS = frozenset({"plant", "grow", "crop", "farm", "soil", "water", "fertilizer", "seed"})
+
+
+def _keyword_pattern(keywords: frozenset) -> "re.Pattern[str]":
+    """Compile a keyword set into one alternation, keeping substring-match semantics"""
+    return re.compile("|".join(re.escape(keyword) for keyword in sorted(keywords)))
+
+
+_CLASSIFICATION_RE = _keyword_pattern(_CLASSIFICATION_KEYWORDS)
+_PRESCRIPTION_RE = _keyword_pattern(_PRESCRIPTION_KEYWORDS)
+_VENDOR_RE = _keyword_pattern(_VENDOR_KEYWORDS)
+_FULL_WORKFLOW_RE = _keyword_pattern(_FULL_WORKFLOW_KEYWORDS)
+_GENERAL_RE = _keyword_pattern(_GENERAL_KEYWORDS)
+_FARMING_RE = _keyword_pattern(_FARMING_KEYWORDS)
+
+
+def _fallback_core(user_message: str) -> Tuple[bool, bool, bool, bool, bool]:
+    """
+    Keyword-based intent flags for the fallback path.
+    
+    Pure function of the message so it can be tested (or compiled) on its own.
+    
+    Returns:
+        (wants_classification, wants_prescription, wants_vendors,
+         wants_full_workflow, is_general_question)
+    """
+    user_message_lower = user_message.lower()
+    
+    # Full workflow implies vendors, vendors imply prescription, prescription implies classification
+    wants_full_workflow = bool(_FULL_WORKFLOW_RE.search(user_message_lower))
+    wants_vendors = wants_full_workflow or bool(_VENDOR_RE.search(user_message_lower))
+    wants_prescription = wants_vendors or bool(_PRESCRIPTION_RE.search(user_message_lower))
+    wants_classification = wants_prescription or bool(_CLASSIFICATION_RE.search(user_message_lower))
+    
+    # General question words + farming context but no specific tool requests
+    is_general_question = (
+        not wants_classification
+        and bool(_GENERAL_RE.search(user_message_lower))
+        and bool(_FARMING_RE.search(user_message_lower))
+    )
+    
+    return wants_classification, wants_prescription, wants_vendors, wants_full_workflow, is_general_question
+
+
+def _route_for(has_image: bool, wants_classification: bool, wants_prescription: bool,
+               wants_vendors: bool, is_general_question: bool) -> str:
+    """Routing rules for a new conversation - evaluated once per combination to build _ACTION_TABLE"""
+    # Check for tool requests first, then handle pure general questions
+    if wants_classification:
+        return "classify" if has_image else "request_image"
+    if is_general_question and not (wants_prescription or wants_vendors):
+        return "general_question"
+    # General greeting or unclear intent
+    return "greeting"
+
+
+# (has_image, wants_classification, wants_prescription, wants_vendors, is_general_question) -> route
+_ACTION_TABLE = {key: _route_for(*key) for key in itertools.product((False, True), repeat=5)}
+
+_GENERAL_ADVICE_SUFFIX = "{message}\n\n🌾 **General Agricultural Advice:** {general_answer}"
+
+# route -> (next_action, message, message template when a general answer exists, requires_user_input)
+_ROUTE_RESPONSES = {
+    "classify": (
+        "classify",
+        "🌱 I can see you've uploaded an image of a plant leaf. Let me analyze it for disease detection.",
+        _GENERAL_ADVICE_SUFFIX,
+        False
+    ),
+    "request_image": (
+        "request_image",
+        "🌱 I'd be happy to help analyze your plant! Please upload a clear photo of the affected leaf showing any symptoms.",
+        _GENERAL_ADVICE_SUFFIX,
+        True
+    ),
+    "greeting": (
+        "general_help",
+        "🌱 Hello! I'm your plant disease diagnosis assistant. I can help you:\n\n"
+        "• **Identify diseases** - Upload a photo for analysis\n"
+        "• **Get treatment recommendations** - Get prescription after diagnosis\n"
+        "• **Find vendors** - Locate suppliers for treatments\n\n"
+        "What would you like me to help you with today?",
+        "🌾 {general_answer}\n\n{message}",
+        True
+    ),
+}
+
 
 class InitialNode(BaseNode):
     """Initial node - handles user input and determines first action based on user intent"""
     
+    # In-flight intent analyses keyed by user message, shared by concurrent identical requests
+    _inflight_intents: Dict[str, "asyncio.Future[Intent]"] = {}
+    
     @property
     def node_name(self) -> str:
         return "initial"
@@ -39,7 +168,10 @@ class InitialNode(BaseNode):
         
         try:
             # Check if this is a continuing conversation (loaded from session)
-            is_continuing_conversation = self._is_continuing_conversation(state)
+            # Memoized per turn: retry loops re-entering this node reuse the decision
+            if "_is_continuing" not in state:
+                state["_is_continuing"] = self._is_continuing_conversation(state)
+            is_continuing_conversation = state["_is_continuing"]
             
             if is_continuing_conversation:
                 # This is a followup in an existing conversation - route to followup handling
@@ -49,7 +181,8 @@ class InitialNode(BaseNode):
             
             # Analyze user intent for NEW conversations
             user_intent = await self._analyze_user_intent(state["user_message"])
-            state["user_intent"] = user_intent
+            # State storage stays a plain dict for the other nodes and session persistence
+            state["user_intent"] = user_intent._asdict()
             
             # FIXED: Check for goodbye intent BEFORE processing other intents
             if await self._detect_goodbye_intent(state):
@@ -66,7 +199,7 @@ class InitialNode(BaseNode):
                 self._process_context_extraction(state, context_result)
             
             # Store general answer for later use (for hybrid requests)
-            general_answer = user_intent.get("general_answer", "")
+            general_answer = user_intent.general_answer
             if general_answer:
                 state["general_answer"] = general_answer
                 logger.info(f"🌾 Stored general answer for hybrid request: {general_answer[:100]}...")
@@ -75,7 +208,7 @@ class InitialNode(BaseNode):
             self._determine_next_action(state, user_intent, general_answer)
             
         except Exception as e:
-            logger.error(f"Error in initial node: {str(e)}", exc_info=True)
+            logger.exception("Error in initial node: %s", e)
             set_error(state, f"Error processing initial request: {str(e)}")
             state["next_action"] = "error"
         
@@ -83,154 +216,147 @@ class InitialNode(BaseNode):
     
     def _process_context_extraction(self, state: WorkflowState, context_result: Dict[str, Any]) -> None:
         """Process context extraction results and update state"""
-        # Debug: Log current state before context processing
-        logger.info(f"🔍 BEFORE context processing - plant_type: {state.get('plant_type')}, location: {state.get('location')}, season: {state.get('season')}")
-        logger.info(f"🔍 Context extractor result: {context_result}")
+        # Debug: Log current state before context processing (lazy %-formatting)
+        logger.info("🔍 BEFORE context processing - plant_type: %s, location: %s, season: %s",
+                    state.get('plant_type'), state.get('location'), state.get('season'))
+        logger.info("🔍 Context extractor result: %s", context_result)
         
         # Preserve existing context from API request, only supplement missing values
-        existing_context = state.get("user_context", {})
+        existing_context = state.get("user_context") or {}
         extracted_context = context_result or {}
         
-        # Merge contexts - API context takes precedence, extractor supplements
-        merged_context = {**extracted_context, **existing_context}
-        state["user_context"] = merged_context
+        # Merge contexts - API context takes precedence, extractor supplements.
+        # Flattened once here because the state is persisted as JSON.
+        state["user_context"] = dict(ChainMap(existing_context, extracted_context))
         
         # Only update individual fields if not already set from API request
-        context_fields = [
-            ("location", "🔄 Updating location from extractor", "✅ Keeping API location"),
-            ("season", "🔄 Updating season from extractor", "✅ Keeping API season"),
-            ("plant_type", "🔄 Updating plant_type from extractor", "✅ Keeping API plant_type"),
-            ("growth_stage", None, None)
-        ]
-        
-        for field, update_msg, keep_msg in context_fields:
+        updated_fields = []
+        for field in _CONTEXT_FIELDS:
             if not state.get(field):
-                if update_msg:
-                    logger.info(f"{update_msg}: {context_result.get(field)}")
                 state[field] = context_result.get(field)
-            else:
-                if keep_msg:
-                    logger.info(f"{keep_msg}: {state.get(field)}")
+                updated_fields.append(field)
         
         # Debug: Log final state after context processing
-        logger.info(f"✅ AFTER context processing - plant_type: {state.get('plant_type')}, location: {state.get('location')}, season: {state.get('season')}")
+        logger.info("✅ AFTER context processing - plant_type: %s, location: %s, season: %s, updated from extractor: %s",
+                    state.get('plant_type'), state.get('location'), state.get('season'), updated_fields)
     
-    def _determine_next_action(self, state: WorkflowState, user_intent: Dict[str, Any], general_answer: str) -> None:
-        """Determine the next action based on user intent"""
-        # Check for tool requests first, then handle pure general questions
-        if state.get("user_image") and user_intent["wants_classification"]:
-            # Has image and user wants classification
-            state["next_action"] = "classify"
-            classification_msg = "🌱 I can see you've uploaded an image of a plant leaf. Let me analyze it for disease detection."
-            
-            # Add general answer if this is a hybrid request
-            if general_answer:
-                classification_msg += f"\n\n🌾 **General Agricultural Advice:** {general_answer}"
-            
-            add_message_to_state(state, "assistant", classification_msg)
-            
-        elif user_intent["wants_classification"] and not state.get("user_image"):
-            # Wants classification but no image
-            state["next_action"] = "request_image"
-            image_request_msg = "🌱 I'd be happy to help analyze your plant! Please upload a clear photo of the affected leaf showing any symptoms."
-            
-            # Add general answer if this is a hybrid request
-            if general_answer:
-                image_request_msg += f"\n\n🌾 **General Agricultural Advice:** {general_answer}"
-            
-            add_message_to_state(state, "assistant", image_request_msg)
+    def _determine_next_action(self, state: WorkflowState, user_intent: Intent, general_answer: str) -> None:
+        """Determine the next action based on user intent via the precomputed route table"""
+        route = _ACTION_TABLE[(
+            bool(state.get("user_image")),
+            bool(user_intent.wants_classification),
+            bool(user_intent.wants_prescription),
+            bool(user_intent.wants_vendors),
+            bool(user_intent.is_general_question)
+        )]
+        
+        if route == "general_question":
+            self._respond_to_general_question(state, general_answer)
+            return
+        
+        next_action, message, answer_template, requires_user_input = _ROUTE_RESPONSES[route]
+        state["next_action"] = next_action
+        
+        # Add general answer if this is a hybrid request
+        if general_answer:
+            message = answer_template.format(message=message, general_answer=general_answer)
+        
+        add_message_to_state(state, "assistant", message)
+        if requires_user_input:
             state["requires_user_input"] = True
+    
+    def _respond_to_general_question(self, state: WorkflowState, general_answer: str) -> None:
+        """Handle a pure general question (no tool requests)"""
+        # Check if this is a plant-related general question that might need clarification
+        user_message_lower = state["user_message"].lower()
+        
+        # Keywords that indicate potential plant disease/diagnosis requests (not general agriculture)
+        plant_health_keywords = ["disease", "diagnose", "analyze", "wrong", "problem", "issue", "sick", "dying", "spots", "infection", "symptom"]
+        plant_help_keywords = ["help", "what's wrong", "can you help", "need help"]
+        
+        # Must have plant context AND health/diagnostic intent 
+        has_plant_context = any(word in user_message_lower for word in ["plant", "leaf", "leaves", "crop"])
+        has_health_intent = any(word in user_message_lower for word in plant_health_keywords)
+        has_help_intent = any(phrase in user_message_lower for phrase in plant_help_keywords)
+        
+        # Plant-related if: (plant context AND health intent) OR (plant context AND help intent)
+        is_plant_related = has_plant_context and (has_health_intent or has_help_intent)
+        
+        if is_plant_related:
+            # FIXED: Plant-related general questions should get clarification, not direct completion
+            logger.info(f"🌱 Plant-related general question detected, routing to clarification instead of direct completion")
+            state["next_action"] = "general_help"
             
-        elif user_intent.get("is_general_question", False) and not any([
-            user_intent["wants_classification"], 
-            user_intent["wants_prescription"], 
-            user_intent["wants_vendors"]
-        ]):
-            # Check if this is a plant-related general question that might need clarification
-            user_message_lower = state["user_message"].lower()
-            
-            # Keywords that indicate potential plant disease/diagnosis requests (not general agriculture)
-            plant_health_keywords = ["disease", "diagnose", "analyze", "wrong", "problem", "issue", "sick", "dying", "spots", "infection", "symptom"]
-            plant_help_keywords = ["help", "what's wrong", "can you help", "need help"]
-            
-            # Must have plant context AND health/diagnostic intent 
-            has_plant_context = any(word in user_message_lower for word in ["plant", "leaf", "leaves", "crop"])
-            has_health_intent = any(word in user_message_lower for word in plant_health_keywords)
-            has_help_intent = any(phrase in user_message_lower for phrase in plant_help_keywords)
-            
-            # Plant-related if: (plant context AND health intent) OR (plant context AND help intent)
-            is_plant_related = has_plant_context and (has_health_intent or has_help_intent)
+            help_msg = "🌱 I can help you with plant disease diagnosis and treatment! "
+            if general_answer:
+                help_msg += f"{general_answer}\n\n"
             
-            if is_plant_related:
-                # FIXED: Plant-related general questions should get clarification, not direct completion
-                logger.info(f"🌱 Plant-related general question detected, routing to clarification instead of direct completion")
-                state["next_action"] = "general_help"
-                
-                help_msg = "🌱 I can help you with plant disease diagnosis and treatment! "
-                if general_answer:
-                    help_msg += f"{general_answer}\n\n"
-                
-                help_msg += """To get started, I can:
+            help_msg += """To get started, I can:
 • **Analyze plant diseases** - Upload a photo of your plant for diagnosis
 • **Recommend treatments** - Get specific treatment plans after diagnosis  
 • **Find suppliers** - Locate vendors for recommended treatments
 
 What would you like me to help you with? Please share more details or upload a plant image."""
-                
-                add_message_to_state(state, "assistant", help_msg)
-                state["requires_user_input"] = True
-                
-            else:
-                # Pure non-plant general question (agriculture advice, weather, etc.)
-                # FIXED: Keep session active - only end on explicit user intent
-                state["next_action"] = "general_help"  # Changed from "completed" to keep session active
-                if general_answer:
-                    add_message_to_state(
-                        state,
-                        "assistant", 
-                        f"🌾 {general_answer}\n\nIs there anything else I can help you with regarding plant disease diagnosis or treatment?"
-                    )
-                else:
-                    add_message_to_state(
-                        state,
-                        "assistant", 
-                        "🌾 I understand you have a general farming question. I can provide basic guidance on agricultural topics, but I specialize in plant disease diagnosis and treatment. Feel free to ask about specific plant issues or upload a photo for disease analysis!"
-                    )
-                state["requires_user_input"] = True  # FIXED: Keep session active for user response
-        else:
-            # General greeting or unclear intent
-            state["next_action"] = "general_help"
-            help_msg = "🌱 Hello! I'm your plant disease diagnosis assistant. I can help you:\n\n" + \
-                      "• **Identify diseases** - Upload a photo for analysis\n" + \
-                      "• **Get treatment recommendations** - Get prescription after diagnosis\n" + \
-                      "• **Find vendors** - Locate suppliers for treatments\n\n" + \
-                      "What would you like me to help you with today?"
-            
-            # Add general answer if available
-            if general_answer:
-                help_msg = f"🌾 {general_answer}\n\n" + help_msg
             
             add_message_to_state(state, "assistant", help_msg)
             state["requires_user_input"] = True
+            
+        else:
+            # Pure non-plant general question (agriculture advice, weather, etc.)
+            # FIXED: Keep session active - only end on explicit user intent
+            state["next_action"] = "general_help"  # Changed from "completed" to keep session active
+            if general_answer:
+                add_message_to_state(
+                    state,
+                    "assistant", 
+                    f"🌾 {general_answer}\n\nIs there anything else I can help you with regarding plant disease diagnosis or treatment?"
+                )
+            else:
+                add_message_to_state(
+                    state,
+                    "assistant", 
+                    "🌾 I understand you have a general farming question. I can provide basic guidance on agricultural topics, but I specialize in plant disease diagnosis and treatment. Feel free to ask about specific plant issues or upload a photo for disease analysis!"
+                )
+            state["requires_user_input"] = True  # FIXED: Keep session active for user response
     
-    async def _analyze_user_intent(self, user_message: str) -> Dict[str, Any]:
+    async def _analyze_user_intent(self, user_message: str) -> Intent:
         """
         Analyze user intent using LLM to determine what they want from the agent.
         This provides much more robust intent recognition than keyword matching.
         Handles both specialized tool requests and general agricultural questions.
+        
+        Concurrent requests with the same message (e.g. app retries) share a single
+        LLM call instead of each sending the same prompt.
         """
+        inflight = self._inflight_intents.get(user_message)
+        if inflight is not None and not inflight.done():
+            logger.info("🔗 Joining in-flight intent analysis for identical message")
+            return await asyncio.shield(inflight)
+        
+        task = asyncio.ensure_future(self._run_intent_analysis(user_message))
+        self._inflight_intents[user_message] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if self._inflight_intents.get(user_message) is task:
+                del self._inflight_intents[user_message]
+    
+    async def _run_intent_analysis(self, user_message: str) -> Intent:
+        """Run the LLM intent analysis, falling back to keywords on failure"""
         try:
             intent_prompt = self._build_intent_analysis_prompt(user_message)
             
-            # Get LLM response
-            response = await self.llm.ainvoke(intent_prompt)
-            response_text = response.content.strip()
+            # Get LLM response (streamed, stops as soon as the JSON object is complete)
+            response_text = await asyncio.wait_for(
+                self._stream_intent_response(intent_prompt),
+                timeout=INTENT_ANALYSIS_TIMEOUT
+            )
             
             logger.debug(f"🧠 LLM intent analysis raw response: {response_text}")
             
             # Parse JSON response
             intent = self._parse_intent_response(response_text)
-            if intent:
+            if intent is not None:
                 logger.info(f"🎯 LLM-driven user intent analysis: {intent}")
                 return intent
                     
@@ -241,6 +367,54 @@ What would you like me to help you with? Please share more details or upload a p
         logger.info("🔄 Using fallback keyword-based intent analysis")
         return await self._fallback_intent_analysis(user_message)
     
+    async def _stream_intent_response(self, intent_prompt: str) -> str:
+        """
+        Stream the intent analysis response and stop consuming tokens once the
+        top-level JSON object has been closed. Anything the model would have
+        generated after the object is never produced.
+        """
+        if not hasattr(self.llm, "astream"):
+            response = await self.llm.ainvoke(intent_prompt)
+            return response.content.strip()
+        
+        chunks = []
+        depth = 0
+        in_string = False
+        escaped = False
+        stream = self.llm.astream(intent_prompt)
+        try:
+            async for chunk in stream:
+                text = getattr(chunk, "content", chunk)
+                if not isinstance(text, str):
+                    text = str(text)
+                
+                for index, char in enumerate(text):
+                    if in_string:
+                        if escaped:
+                            escaped = False
+                        elif char == "\\":
+                            escaped = True
+                        elif char == '"':
+                            in_string = False
+                    elif char == '"' and depth > 0:
+                        in_string = True
+                    elif char == "{":
+                        depth += 1
+                    elif char == "}" and depth > 0:
+                        depth -= 1
+                        if depth == 0:
+                            chunks.append(text[:index + 1])
+                            return "".join(chunks).strip()
+                
+                chunks.append(text)
+        finally:
+            # Closing the generator cancels the underlying HTTP stream
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        
+        return "".join(chunks).strip()
+    
     async def _detect_goodbye_intent(self, state) -> bool:
         """
         Detect if user wants to end the session using LLM analysis
@@ -323,107 +497,64 @@ User message: "{user_message}"
 
 Response (JSON only):"""
     
-    def _parse_intent_response(self, response_text: str) -> Optional[Dict[str, Any]]:
+    def _parse_intent_response(self, response_text: str) -> Optional[Intent]:
         """Parse the LLM intent response"""
         try:
-            import json
-            # Extract JSON from response (in case there's extra text)
-            json_start = response_text.find('{')
-            json_end = response_text.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = response_text[json_start:json_end]
-                intent = json.loads(json_str)
-                
-                # Ensure all required keys exist with defaults
-                default_intent = {
-                    "wants_classification": False,
-                    "wants_prescription": False,
-                    "wants_vendors": False,
-                    "wants_full_workflow": False,
-                    "is_general_question": False,
-                    "general_answer": ""
-                }
-                default_intent.update(intent)
-                intent = default_intent
-                
-                # Apply dependency rules (ensure logical consistency)
-                # Only apply tool dependency rules if it's not a general question
-                if not intent.get("is_general_question", False):
-                    if intent.get("wants_prescription") or intent.get("wants_vendors") or intent.get("wants_full_workflow"):
-                        intent["wants_classification"] = True
-                    
-                    if intent.get("wants_vendors") or intent.get("wants_full_workflow"):
-                        intent["wants_prescription"] = True
-                        intent["wants_classification"] = True
-                    
-                    if intent.get("wants_full_workflow"):
-                        intent["wants_vendors"] = True
-                        intent["wants_prescription"] = True
-                        intent["wants_classification"] = True
-                
-                return intent
-                
-            else:
-                logger.warning("🚨 Could not find valid JSON in LLM response, using fallback analysis")
+            # Fast path: the prompt asks for JSON only, so try the whole response first
+            try:
+                intent = _json_loads(response_text)
+            except json.JSONDecodeError:
+                intent = None
+            
+            if not isinstance(intent, dict):
+                # Extract JSON from response (in case there's extra text)
+                json_start = response_text.find('{')
+                json_end = response_text.rfind('}') + 1
+                if json_start == -1 or json_end <= json_start:
+                    logger.warning("🚨 Could not find valid JSON in LLM response, using fallback analysis")
+                    return None
+                intent = _json_loads(response_text[json_start:json_end])
+            
+            # Missing keys fall back to the Intent defaults
+            intent = Intent.from_dict(intent)
+            
+            # Apply dependency rules (ensure logical consistency)
+            # Only apply tool dependency rules if it's not a general question
+            if not intent.is_general_question:
+                if intent.wants_full_workflow:
+                    intent = intent._replace(wants_vendors=True, wants_prescription=True, wants_classification=True)
+                elif intent.wants_vendors:
+                    intent = intent._replace(wants_prescription=True, wants_classification=True)
+                elif intent.wants_prescription:
+                    intent = intent._replace(wants_classification=True)
+            
+            return intent
                 
         except json.JSONDecodeError as e:
             logger.warning(f"🚨 Failed to parse JSON from LLM response: {e}, using fallback analysis")
             
         return None
     
-    async def _fallback_intent_analysis(self, user_message: str) -> Dict[str, Any]:
+    async def _fallback_intent_analysis(self, user_message: str) -> Intent:
         """
         Fallback intent analysis using simple keyword matching.
         Used when LLM-based analysis fails.
         """
-        user_message_lower = user_message.lower()
-        
-        intent = {
-            "wants_classification": False,
-            "wants_prescription": False,
-            "wants_vendors": False,
-            "wants_full_workflow": False,
-            "is_general_question": False,
-            "general_answer": ""
-        }
-        
-        # Classification keywords
-        classification_keywords = ["analyze", "detect", "identify", "classify", "disease", "what", "wrong", "issue", "problem"]
-        if any(word in user_message_lower for word in classification_keywords):
-            intent["wants_classification"] = True
-        
-        # Prescription keywords
-        prescription_keywords = ["treatment", "cure", "fix", "help", "recommend", "prescription", "medicine", "spray"]
-        if any(word in user_message_lower for word in prescription_keywords):
-            intent["wants_prescription"] = True
-            intent["wants_classification"] = True  # Need classification first
-        
-        # Vendor keywords
-        vendor_keywords = ["buy", "purchase", "order", "vendor", "shop", "price", "cost"]
-        if any(word in user_message_lower for word in vendor_keywords):
-            intent["wants_vendors"] = True
-            intent["wants_prescription"] = True  # Need prescription first
-            intent["wants_classification"] = True  # Need classification first
-        
-        # Full workflow keywords
-        full_keywords = ["complete", "full", "everything", "all", "comprehensive"]
-        if any(word in user_message_lower for word in full_keywords):
-            intent["wants_full_workflow"] = True
-            intent["wants_vendors"] = True
-            intent["wants_prescription"] = True
-            intent["wants_classification"] = True
-        
-        # Check for general questions (fallback has limited capability)
-        general_keywords = ["how", "when", "why", "what", "where", "best time", "tips", "advice", "weather", "climate"]
-        farming_keywords = ["plant", "grow", "crop", "farm", "soil", "water", "fertilizer", "seed"]
-        
-        # If it contains general question words + farming context but no specific tool requests
-        if (any(word in user_message_lower for word in general_keywords) and 
-            any(word in user_message_lower for word in farming_keywords) and 
-            not any([intent["wants_classification"], intent["wants_prescription"], intent["wants_vendors"]])):
-            
-            intent["is_general_question"] = True
-            intent["general_answer"] = "I understand you have a general farming question. For the best answer, please try again when the LLM system is available, or feel free to ask about specific plant diseases or issues that I can help diagnose and treat."
+        (wants_classification, wants_prescription, wants_vendors,
+         wants_full_workflow, is_general_question) = _fallback_core(user_message)
+        
+        general_answer = ""
+        if is_general_question:
+            general_answer = "I understand you have a general farming question. For the best answer, please try again when the LLM system is available, or feel free to ask about specific plant diseases or issues that I can help diagnose and treat."
+        
+        intent = Intent(
+            wants_classification=wants_classification,
+            wants_prescription=wants_prescription,
+            wants_vendors=wants_vendors,
+            wants_full_workflow=wants_full_workflow,
+            is_general_question=is_general_question,
+            general_answer=general_answer
+        )
         
         logger.info(f"📝 Fallback intent analysis: {intent}")
         return intent
@@ -473,15 +604,17 @@ Response (JSON only):"""
         # Conversation history = meaningful conversation OR workflow results
         has_conversation_history = has_meaningful_conversation or has_workflow_results
         
-        # Debug logging for session analysis
+        # Debug logging for session analysis (skip f-string formatting when INFO is off)
         current_user_message = state.get("user_message", "")
-        logger.info(f"🔍 Session conversation analysis:")
-        logger.info(f"   - Current message: '{current_user_message[:50]}...'")
-        logger.info(f"   - Total messages in session: {len(messages)}")
-        logger.info(f"   - Assistant messages: {len(assistant_messages)}")
-        logger.info(f"   - User messages: {len(user_messages)}")
-        logger.info(f"   - Has workflow results: {has_workflow_results}")
-        logger.info(f"   - Has meaningful conversation: {has_meaningful_conversation}")
+        log_info = logger.isEnabledFor(logging.INFO)
+        if log_info:
+            logger.info(f"🔍 Session conversation analysis:")
+            logger.info(f"   - Current message: '{current_user_message[:50]}...'")
+            logger.info(f"   - Total messages in session: {len(messages)}")
+            logger.info(f"   - Assistant messages: {len(assistant_messages)}")
+            logger.info(f"   - User messages: {len(user_messages)}")
+            logger.info(f"   - Has workflow results: {has_workflow_results}")
+            logger.info(f"   - Has meaningful conversation: {has_meaningful_conversation}")
         
         # Check for potential app duplicate pattern
         if len(user_messages) > 1 and len(assistant_messages) == 0:
@@ -508,21 +641,22 @@ Response (JSON only):"""
         
         is_continuing = (has_previous_results or has_conversation_history or was_in_middle_of_workflow) and not should_treat_completed_as_new
         
-        if is_continuing:
-            logger.info(f"🔍 Continuing conversation detected:")
-            logger.info(f"   - Has previous results: {has_previous_results}")
-            logger.info(f"   - Has conversation history: {has_conversation_history} ({len(assistant_messages)} assistant, {len(user_messages)} user messages)")
-            logger.info(f"   - Was in middle of workflow: {was_in_middle_of_workflow} (node: {current_node})")
-            logger.info(f"   - Is in completed state: {is_in_completed_state}")
-            logger.info(f"   - Should treat completed as new: {should_treat_completed_as_new}")
-        else:
-            logger.info(f"🆕 New conversation detected for session {state['session_id']}")
-            logger.info(f"   - Session ended: {session_ended}")
-            logger.info(f"   - In completed state: {is_in_completed_state}")
-            logger.info(f"   - Should treat completed as new: {should_treat_completed_as_new}")
-            logger.info(f"   - Assistant messages: {len(assistant_messages)}")
-            logger.info(f"   - User messages: {len(user_messages)}")
-            if len(user_messages) > 0 and len(assistant_messages) == 0:
-                logger.info(f"   - ⚠️ User messages without assistant responses detected (possible app duplicate)")
+        if log_info:
+            if is_continuing:
+                logger.info(f"🔍 Continuing conversation detected:")
+                logger.info(f"   - Has previous results: {has_previous_results}")
+                logger.info(f"   - Has conversation history: {has_conversation_history} ({len(assistant_messages)} assistant, {len(user_messages)} user messages)")
+                logger.info(f"   - Was in middle of workflow: {was_in_middle_of_workflow} (node: {current_node})")
+                logger.info(f"   - Is in completed state: {is_in_completed_state}")
+                logger.info(f"   - Should treat completed as new: {should_treat_completed_as_new}")
+            else:
+                logger.info(f"🆕 New conversation detected for session {state['session_id']}")
+                logger.info(f"   - Session ended: {session_ended}")
+                logger.info(f"   - In completed state: {is_in_completed_state}")
+                logger.info(f"   - Should treat completed as new: {should_treat_completed_as_new}")
+                logger.info(f"   - Assistant messages: {len(assistant_messages)}")
+                logger.info(f"   - User messages: {len(user_messages)}")
+                if len(user_messages) > 0 and len(assistant_messages) == 0:
+                    logger.info(f"   - ⚠️ User messages without assistant responses detected (possible app duplicate)")
         
         return is_continuing
@@ -3,8 +3,10 @@ Prescribing Node for FSM Agent workflow
 Generates treatment recommendations
 """
 
+import copy
 import logging
-from typing import Dict, Any
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
 from .base_node import BaseNode
 
@@ -17,10 +19,16 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of generated prescriptions kept in the in-process LRU cache
+PRESCRIPTION_CACHE_SIZE = 128
+
 
 class PrescribingNode(BaseNode):
     """Prescription node - generates treatment recommendations"""
     
+    # Shared across instances: the prescription is driven by the diagnosis, not the user
+    _prescription_cache: "OrderedDict[Tuple[str, ...], Dict[str, Any]]" = OrderedDict()
+    
     @property
     def node_name(self) -> str:
         return "prescribing"
@@ -73,7 +81,15 @@ class PrescribingNode(BaseNode):
                 "user_context": state.get("user_context", {})
             }
             
-            result = await prescription_tool.arun(prescription_input)
+            cache_key = self._prescription_cache_key(prescription_input)
+            result = self._get_cached_prescription(cache_key)
+            if result is not None:
+                logger.info(f"⚡ Using cached prescription for {cache_key}")
+            else:
+                result = await prescription_tool.arun(prescription_input)
+                # Fallback prescriptions are generic placeholders - let the next request retry RAG
+                if result and not result.get("error") and not result.get("fallback"):
+                    self._store_cached_prescription(cache_key, result)
             
             if result and not result.get("error"):
                 self._process_successful_prescription(state, result)
@@ -81,11 +97,34 @@ class PrescribingNode(BaseNode):
                 self._process_failed_prescription(state, result)
         
         except Exception as e:
-            logger.error(f"Error in prescribing node: {str(e)}", exc_info=True)
+            logger.exception("Error in prescribing node: %s", e)
             self._handle_prescription_exception(state, e)
         
         return state
     
+    @staticmethod
+    def _prescription_cache_key(prescription_input: Dict[str, Any]) -> Tuple[str, ...]:
+        """Build the cache key; user_context is excluded since it barely affects the plan"""
+        return tuple(
+            str(prescription_input.get(field) or "").strip().lower()
+            for field in ("disease_name", "plant_type", "location", "severity", "season")
+        )
+    
+    def _get_cached_prescription(self, key: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached prescription, marking it most recently used"""
+        cached = self._prescription_cache.get(key)
+        if cached is None:
+            return None
+        self._prescription_cache.move_to_end(key)
+        return copy.deepcopy(cached)
+    
+    def _store_cached_prescription(self, key: Tuple[str, ...], result: Dict[str, Any]) -> None:
+        """Store a prescription, evicting the least recently used entry when full"""
+        self._prescription_cache[key] = copy.deepcopy(result)
+        self._prescription_cache.move_to_end(key)
+        if len(self._prescription_cache) > PRESCRIPTION_CACHE_SIZE:
+            self._prescription_cache.popitem(last=False)
+    
     def _process_successful_prescription(self, state: WorkflowState, result: Dict[str, Any]) -> None:
         """Process successful prescription generation"""
         state["prescription_data"] = result
@@ -106,8 +145,11 @@ class PrescribingNode(BaseNode):
         add_message_to_state(state, "assistant", response)
         
         # Determine next action based on user intent
-        user_intent = state.get("user_intent", {})
-        if user_intent.get("wants_vendors", False):
+        user_intent = state.get("user_intent") or {}
+        wants_vendors = user_intent.get("wants_vendors", False)
+        general_answer = state.get("general_answer")
+        
+        if wants_vendors:
             state["next_action"] = "vendor_query"
         else:
             # Prescription complete - route back to followup for user's next choice
@@ -117,8 +159,8 @@ class PrescribingNode(BaseNode):
             completion_msg = "✅ **Treatment Plan Complete!** If you'd like to find vendors to purchase these treatments, just let me know!"
             
             # Add general answer if this was a hybrid request
-            if state.get("general_answer"):
-                completion_msg += f"\n\n🌾 **General Agricultural Advice:** {state['general_answer']}"
+            if general_answer:
+                completion_msg += f"\n\n🌾 **General Agricultural Advice:** {general_answer}"
             
             add_message_to_state(state, "assistant", completion_msg)
     
@@ -156,38 +198,39 @@ class PrescribingNode(BaseNode):
         preventive_measures = prescription_data.get("preventive_measures", [])
         additional_notes = prescription_data.get("notes")
         
-        response = f"""💊 **TREATMENT PLAN FOR YOUR PLANT**
+        # Collect sections and join once instead of growing a string with +=
+        parts = ["""💊 **TREATMENT PLAN FOR YOUR PLANT**
 
-🌿 **MEDICINES TO USE**"""
+🌿 **MEDICINES TO USE**"""]
         
         for i, treatment in enumerate(treatments, 1):
             treatment_name = treatment.get('name', 'Unknown Treatment')
             treatment_type = treatment.get('type', 'N/A')
             
-            response += f"""
+            parts.append(f"""
 
 🔹 **MEDICINE #{i}: {treatment_name}**
 • **What it is:** {treatment_type}
 • **How to apply:** {treatment.get('application', 'Follow bottle instructions')}
 • **How much:** {treatment.get('dosage', 'As directed on package')}
 • **How often:** {treatment.get('frequency', 'Check instructions')}
-• **For how long:** {treatment.get('duration', 'Until plant looks better')}"""
+• **For how long:** {treatment.get('duration', 'Until plant looks better')}""")
         
         if preventive_measures:
-            response += f"""
+            parts.append("""
 
-🛡️ **HOW TO PREVENT THIS DISEASE**"""
+🛡️ **HOW TO PREVENT THIS DISEASE**""")
             for i, measure in enumerate(preventive_measures, 1):
-                response += f"""
-{i}. {measure}"""
+                parts.append(f"""
+{i}. {measure}""")
         
         if additional_notes:
-            response += f"""
+            parts.append(f"""
 
 ⚠️ **IMPORTANT TIPS**
-{additional_notes}"""
+{additional_notes}""")
         
-        response += f"""
+        parts.append("""
 
 ✅ **REMEMBER**
 • Always read the medicine bottle instructions
@@ -195,9 +238,9 @@ class PrescribingNode(BaseNode):
 • Ask local experts if you need help
 • Keep notes about what works
 
-💚 **Your plant will get better with proper care!**"""
+💚 **Your plant will get better with proper care!**""")
         
-        return response
+        return "".join(parts)
     
     def _get_classification_from_session(self, state: WorkflowState) -> Dict[str, Any]:
         """
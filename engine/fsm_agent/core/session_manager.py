@@ -3,16 +3,52 @@ Session Manager for FSM Agent Workflow
 Handles state persistence between LangGraph invocations
 """
 
-import json
+import glob
+import hashlib
+import mmap
 import os
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
 
+from ._json_utils import JSONDecodeError, dumps, loads
 from .workflow_state import WorkflowState, create_initial_state
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
+# Compact the per-session delta journal into a fresh snapshot once it grows past either limit
+JOURNAL_MAX_BYTES = 64 * 1024
+JOURNAL_MAX_LINES = 50
+
+# Snapshots are zstd-compressed when zstandard is installed; readers detect them by the frame magic
+SNAPSHOT_COMPRESSION_LEVEL = 3
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# user_image values longer than this (characters) are stored once in a sidecar file
+IMAGE_SIDECAR_MIN_CHARS = 8 * 1024
+
+# Sidecar file names: <session_id>.<16 hex digit content digest>.img
+_IMAGE_SIDECAR_RE = re.compile(r"(.+)\.[0-9a-f]{16}\.img")
+
+# Sessions untouched for longer than this (seconds) are expired
+EXPIRY_SECONDS = 24 * 3600
+
+# Number of recently saved session states kept in memory
+STATE_CACHE_SIZE = 128
+
+# Writes queued within this window (seconds) are coalesced by the background flusher
+FLUSH_WINDOW_SECONDS = 0.05
+
 
 class SessionManager:
     """Manages session state persistence for the FSM Agent workflow"""
@@ -26,12 +62,368 @@ class SessionManager:
         """
         self.storage_dir = storage_dir
         os.makedirs(storage_dir, exist_ok=True)
+        
+        # What is already on disk per session (snapshot id, message count, keys, journal length),
+        # used to decide whether the next save can be an appended delta
+        self._persisted: Dict[str, Dict[str, Any]] = {}
+        
+        # Image last written to (or read from) a sidecar per session, with the sidecar's file name
+        self._sidecar_images: Dict[str, Tuple[str, str]] = {}
+        
+        # LRU of states saved by this process; an entry is only reused while the session's
+        # on-disk stamp still matches the one recorded in _persisted at that save
+        self._cache: OrderedDict[str, WorkflowState] = OrderedDict()
+        
+        # Disk writes are serialized on the caller's thread and performed by a background
+        # flusher; _inflight counts queued writes per session until they reach disk
+        self._write_queue: "queue.Queue[Tuple[str, str, bytes]]" = queue.Queue()
+        self._inflight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Notified whenever a session's last queued write has been applied
+        self._session_flushed = threading.Condition(self._lock)
+        self._compressor = zstandard.ZstdCompressor(level=SNAPSHOT_COMPRESSION_LEVEL) if zstandard else None
+        self._flusher_thread = threading.Thread(target=self._flusher, name="session-flusher", daemon=True)
+        self._flusher_thread.start()
         logger.info(f"SessionManager initialized with storage: {storage_dir}")
     
     def _get_session_file(self, session_id: str) -> str:
-        """Get the file path for a session"""
+        """Get the file path for a session snapshot"""
         return os.path.join(self.storage_dir, f"{session_id}.json")
     
+    def _get_journal_file(self, session_id: str) -> str:
+        """Get the file path for a session's delta journal (JSON Lines)"""
+        return os.path.join(self.storage_dir, f"{session_id}.jsonl")
+    
+    def _disk_stamp(self, session_id: str) -> Optional[Tuple[int, int, int]]:
+        """(snapshot mtime, journal mtime, journal size) in ns/bytes, or None if there is no snapshot"""
+        try:
+            snapshot = os.stat(self._get_session_file(session_id))
+        except FileNotFoundError:
+            return None
+        try:
+            journal = os.stat(self._get_journal_file(session_id))
+        except FileNotFoundError:
+            return (snapshot.st_mtime_ns, 0, 0)
+        return (snapshot.st_mtime_ns, journal.st_mtime_ns, journal.st_size)
+    
+    def _cache_state(self, state: WorkflowState) -> None:
+        """Keep a just-saved state in the LRU, evicting the least recently saved session"""
+        session_id = state["session_id"]
+        with self._lock:
+            self._cache[session_id] = state
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > STATE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+    
+    @staticmethod
+    def _image_file_name(session_id: str, image: str) -> str:
+        """
+        File name for a user_image sidecar
+        
+        Named by content, so references already on disk keep pointing at the image they
+        were written with when the session's image changes.
+        """
+        digest = hashlib.blake2b(image.encode("utf-8"), digest_size=8).hexdigest()
+        return f"{session_id}.{digest}.img"
+    
+    def _remove_session_files(self, session_id: str) -> None:
+        """Delete a session's snapshot, journal and image sidecars and forget its bookkeeping"""
+        # The glob also matches sidecars of a session named "<session_id>.<x>", so check the exact name
+        image_files = []
+        for path in glob.glob(os.path.join(glob.escape(self.storage_dir), f"{glob.escape(session_id)}.*.img")):
+            match = _IMAGE_SIDECAR_RE.fullmatch(os.path.basename(path))
+            if match is not None and match.group(1) == session_id:
+                image_files.append(path)
+        for path in (self._get_session_file(session_id), self._get_journal_file(session_id), *image_files):
+            if os.path.exists(path):
+                os.remove(path)
+        self._persisted.pop(session_id, None)
+        with self._lock:
+            self._cache.pop(session_id, None)
+        self._sidecar_images.pop(session_id, None)
+    
+    @staticmethod
+    def _message_key(message: Dict[str, Any]) -> List[Any]:
+        """Identity of a message, used to check the persisted history prefix is unchanged"""
+        return [message.get("role"), message.get("content"), message.get("timestamp")]
+    
+    @staticmethod
+    def _key_hashes(serializable_state: Dict[str, Any]) -> Dict[str, bytes]:
+        """Content hash of every serialized non-message value, used to journal only changed keys"""
+        return {
+            key: hashlib.blake2b(dumps(value), digest_size=16).digest()
+            for key, value in serializable_state.items()
+            if key != "messages"
+        }
+    
+    def _persisted_entry(self, snapshot_id: Any, state: Dict[str, Any], key_hashes: Dict[str, bytes],
+                         journal_lines: int, journal_bytes: int,
+                         stamp: Optional[Tuple[int, int, int]] = None) -> Dict[str, Any]:
+        """
+        Bookkeeping for what is (or, once queued writes land, will be) on disk for a session
+        
+        The stamp is filled in by the flusher after the write; it is only known up front on load.
+        """
+        messages = state.get("messages", [])
+        return {
+            "snapshot_id": snapshot_id,
+            "stamp": stamp,
+            "message_count": len(messages),
+            "last_message": self._message_key(messages[-1]) if messages else None,
+            "key_hashes": key_hashes,
+            "journal_lines": journal_lines,
+            "journal_bytes": journal_bytes,
+        }
+    
+    def _delta_base(self, state: WorkflowState) -> Optional[Dict[str, Any]]:
+        """
+        Return the persisted bookkeeping if the state can be saved as an appended delta
+        
+        A delta is only possible when the on-disk history is an unchanged prefix of the
+        current messages and the journal is still below the compaction limits.
+        """
+        session_id = state["session_id"]
+        persisted = self._persisted.get(session_id)
+        if persisted is None:
+            return None
+        
+        # Another writer touched (or removed) the snapshot or journal - our bookkeeping is stale.
+        # While our own writes are still queued the bookkeeping is ahead of the disk, not behind it.
+        with self._lock:
+            pending = session_id in self._inflight
+            expected_stamp = persisted["stamp"]
+        if not pending:
+            stamp = self._disk_stamp(session_id)
+            if stamp is None or stamp != expected_stamp:
+                return None
+        
+        messages = state["messages"]
+        count = persisted["message_count"]
+        if len(messages) < count:
+            return None
+        if count and self._message_key(messages[count - 1]) != persisted["last_message"]:
+            return None
+        
+        if persisted["journal_lines"] >= JOURNAL_MAX_LINES or persisted["journal_bytes"] >= JOURNAL_MAX_BYTES:
+            return None
+        
+        return persisted
+    
+    def _enqueue_write(self, session_id: str, kind: str, payload: bytes, persisted: Dict[str, Any]) -> None:
+        """
+        Record the bookkeeping for a write and hand its payload to the flusher
+        
+        Args:
+            session_id: Session ID
+            kind: "snapshot" (replaces the snapshot file) or "delta" (appended to the journal)
+            payload: Serialized bytes to write
+            persisted: Bookkeeping describing the session once this write has landed
+        """
+        with self._lock:
+            self._persisted[session_id] = persisted
+            self._inflight[session_id] = self._inflight.get(session_id, 0) + 1
+            self._write_queue.put_nowait((session_id, kind, payload))
+    
+    def _flusher(self) -> None:
+        """Background loop: collect queued writes for a short window and apply them in one go"""
+        while True:
+            batch = [self._write_queue.get()]
+            deadline = time.monotonic() + FLUSH_WINDOW_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            writes: Dict[str, List[Tuple[str, bytes]]] = {}
+            for session_id, kind, payload in batch:
+                writes.setdefault(session_id, []).append((kind, payload))
+            
+            for session_id, session_writes in writes.items():
+                self._apply_writes(session_id, session_writes)
+            
+            for _ in batch:
+                self._write_queue.task_done()
+    
+    @staticmethod
+    def _replace_file(path: str, payload: bytes) -> None:
+        """
+        Atomically replace path with payload
+        
+        The data goes to a per-process temp file that is renamed over the target, so readers
+        (in this or another process) always see either the old or the new complete file.
+        """
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_file, path)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+    
+    def _apply_writes(self, session_id: str, writes: List[Tuple[str, bytes]]) -> None:
+        """Write one session's queued payloads, coalesced, then record the resulting disk stamp"""
+        count = len(writes)
+        try:
+            # Only the newest snapshot matters; deltas queued before it are already part of it
+            last_snapshot = max((i for i, (kind, _) in enumerate(writes) if kind == "snapshot"), default=None)
+            if last_snapshot is not None:
+                payload = writes[last_snapshot][1]
+                if self._compressor is not None:
+                    payload = self._compressor.compress(payload)
+                self._replace_file(self._get_session_file(session_id), payload)
+                
+                # Journal lines carry the old snapshot id, so a crash before this point is harmless
+                journal_file = self._get_journal_file(session_id)
+                if os.path.exists(journal_file):
+                    os.remove(journal_file)
+                writes = writes[last_snapshot + 1:]
+            
+            # Consecutive deltas go out as a single append
+            if writes:
+                with open(self._get_journal_file(session_id), 'ab') as f:
+                    f.write(b"".join(payload for _, payload in writes))
+            failed = False
+        except Exception as e:
+            logger.error(f"❌ Failed to write state for session {session_id}: {str(e)}")
+            failed = True
+        
+        with self._lock:
+            if failed:
+                # The disk no longer matches our bookkeeping: the next save writes a full snapshot
+                self._persisted.pop(session_id, None)
+                self._cache.pop(session_id, None)
+            
+            remaining = self._inflight[session_id] - count
+            if remaining:
+                self._inflight[session_id] = remaining
+                return
+            del self._inflight[session_id]
+            
+            persisted = self._persisted.get(session_id)
+            if persisted is not None:
+                persisted["stamp"] = self._disk_stamp(session_id)
+            self._session_flushed.notify_all()
+    
+    def flush(self) -> None:
+        """Block until every queued write has reached disk (call before shutdown)"""
+        self._write_queue.join()
+    
+    def _wait_for_session_writes(self, session_id: str) -> None:
+        """Block until this session's queued writes have reached disk, ignoring other sessions' writes"""
+        with self._lock:
+            while session_id in self._inflight:
+                self._session_flushed.wait()
+
+    def session_exists(self, session_id: str) -> bool:
+        """Check whether a session has a queued write in this process or a snapshot on disk"""
+        with self._lock:
+            if session_id in self._inflight or session_id in self._cache:
+                return True
+        return os.path.exists(self._get_session_file(session_id))
+
+    def _save_delta(self, state: WorkflowState, serializable_state: Dict[str, Any],
+                    persisted: Dict[str, Any], keys: Optional[List[str]] = None) -> None:
+        """Append new messages plus the non-message keys that changed (or only `keys`) to the journal"""
+        session_id = state["session_id"]
+        count = persisted["message_count"]
+        persisted_hashes = persisted["key_hashes"]
+        
+        if keys is None:
+            key_hashes = self._key_hashes(serializable_state)
+            changed = {
+                key: serializable_state[key]
+                for key, digest in key_hashes.items()
+                if persisted_hashes.get(key) != digest
+            }
+            removed = sorted(persisted_hashes.keys() - key_hashes.keys())
+        else:
+            # A partial delta leaves the remaining keys as they were on disk
+            changed = {key: serializable_state[key] for key in keys if key in serializable_state}
+            key_hashes = {**persisted_hashes, **self._key_hashes(changed)}
+            removed = []
+        
+        line = dumps({
+            "snapshot": persisted["snapshot_id"],
+            "messages_from": count,
+            "messages": serializable_state["messages"][count:],
+            "set": changed,
+            "unset": removed,
+        }) + b"\n"
+        
+        entry = self._persisted_entry(
+            persisted["snapshot_id"], state, key_hashes,
+            persisted["journal_lines"] + 1, persisted["journal_bytes"] + len(line)
+        )
+        self._enqueue_write(session_id, "delta", line, entry)
+    
+    def _write_snapshot(self, state: WorkflowState, serializable_state: Dict[str, Any]) -> None:
+        """Queue a full snapshot; the flusher truncates the journal it supersedes"""
+        session_id = state["session_id"]
+        snapshot_id = time.time_ns()
+        
+        payload = dumps({**serializable_state, "_snapshot_id": snapshot_id})
+        entry = self._persisted_entry(snapshot_id, state, self._key_hashes(serializable_state), 0, 0)
+        self._enqueue_write(session_id, "snapshot", payload, entry)
+    
+    @staticmethod
+    def _read_snapshot(session_file: str) -> Dict[str, Any]:
+        """Decode a (possibly zstd-compressed) snapshot file, mapping it into memory instead of copying it"""
+        with open(session_file, 'rb') as f:
+            # mmap cannot map an empty file; let the decoder report it as invalid JSON
+            if os.fstat(f.fileno()).st_size == 0:
+                return loads(f.read())
+            
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    if view[:4] == _ZSTD_MAGIC:
+                        if zstandard is None:
+                            raise RuntimeError("snapshot is zstd-compressed but zstandard is not installed")
+                        return loads(zstandard.ZstdDecompressor().decompress(view))
+                    return loads(view)
+                finally:
+                    view.release()
+    
+    def _replay_journal(self, session_id: str, state: Dict[str, Any], snapshot_id: Any) -> int:
+        """
+        Apply journal records written against the loaded snapshot
+        
+        Returns:
+            Number of lines in the journal (stale ones included) for compaction accounting
+        """
+        journal_file = self._get_journal_file(session_id)
+        if not os.path.exists(journal_file):
+            return 0
+        
+        lines = 0
+        with open(journal_file, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                lines += 1
+                try:
+                    delta = loads(line)
+                except JSONDecodeError:
+                    logger.warning(f"⚠️ Ignoring torn journal record for session {session_id}")
+                    break
+                
+                if delta.get("snapshot") != snapshot_id:
+                    continue
+                
+                # Replacing from the recorded offset keeps replay idempotent
+                state["messages"][delta["messages_from"]:] = delta["messages"]
+                state.update(delta["set"])
+                for key in delta["unset"]:
+                    state.pop(key, None)
+        
+        return lines
+    
     def save_state(self, state: WorkflowState) -> None:
         """
         Save workflow state to disk
@@ -45,8 +437,6 @@ class SessionManager:
                 logger.error(f"❌ Refusing to save corrupted state for session {state.get('session_id', 'unknown')}")
                 return
             
-            session_file = self._get_session_file(state["session_id"])
-            
             # Convert state to JSON-serializable format
             serializable_state = self._serialize_state(state)
             
@@ -62,8 +452,13 @@ class SessionManager:
             logger.info(f"   - Has prescription: {has_prescription}")
             logger.info(f"   - Current node: {current_node}")
             
-            with open(session_file, 'w') as f:
-                json.dump(serializable_state, f, indent=2, default=str)
+            # Append only what changed while the journal is small; otherwise compact
+            persisted = self._delta_base(state)
+            if persisted is not None:
+                self._save_delta(state, serializable_state, persisted)
+            else:
+                self._write_snapshot(state, serializable_state)
+            self._cache_state(state)
             
             logger.info(f"✅ Successfully saved state for session {state['session_id']}")
             
@@ -83,22 +478,53 @@ class SessionManager:
         try:
             session_file = self._get_session_file(session_id)
             
-            if not os.path.exists(session_file):
+            # The cached copy is handed over to the caller (save_state puts it back), so a
+            # state that is being worked on is never shared with a later load
+            with self._lock:
+                cached = self._cache.pop(session_id, None)
+                pending = session_id in self._inflight
+            
+            # With writes still queued the cached state is newer than the disk; serve it rather
+            # than waiting behind the flusher. Otherwise let this session's writes land first; this
+            # blocks, so async callers go through asyncio.to_thread.
+            if pending:
+                if cached is not None:
+                    logger.info(f"📂 Loaded cached state for session {session_id} with node: {cached.get('current_node')}")
+                    return cached
+                self._wait_for_session_writes(session_id)
+            
+            stamp = self._disk_stamp(session_id)
+            if stamp is None:
                 logger.info(f"📭 No saved state found for session {session_id}")
                 return None
             
-            # Check if session is expired (24 hours)
-            file_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(session_file))
-            if file_age > timedelta(hours=24):
+            # Check if session is expired
+            last_write = max(stamp[0], stamp[1]) / 1e9
+            if time.time() - last_write > EXPIRY_SECONDS:
                 logger.info(f"⏰ Session {session_id} expired, removing old state")
-                os.remove(session_file)
+                self._remove_session_files(session_id)
                 return None
             
-            with open(session_file, 'r') as f:
-                serialized_state = json.load(f)
+            # Reuse what this process last saved unless another writer has touched the files since;
+            # a stat is all it takes to skip reading and decoding the snapshot and journal
+            persisted = self._persisted.get(session_id)
+            if cached is not None and persisted is not None and persisted["stamp"] == stamp:
+                state = cached
+                logger.info(f"📂 Loaded cached state for session {session_id} with node: {state.get('current_node')}")
+                return state
+            
+            serialized_state = self._read_snapshot(session_file)
+            
+            # Replay deltas appended since the snapshot was written
+            snapshot_id = serialized_state.pop("_snapshot_id", None)
+            journal_lines = self._replay_journal(session_id, serialized_state, snapshot_id)
+            key_hashes = self._key_hashes(serialized_state)
             
             # Convert back to WorkflowState
             state = self._deserialize_state(serialized_state)
+            self._persisted[session_id] = self._persisted_entry(
+                snapshot_id, state, key_hashes, journal_lines, stamp[2], stamp
+            )
             
             logger.info(f"📂 Loaded state for session {session_id} with node: {state.get('current_node')}")
             return state
@@ -130,6 +556,8 @@ class SessionManager:
             # Update with new user message
             existing_state["user_message"] = user_message
             existing_state["last_update_time"] = datetime.now()
+            # New turn: drop the previous turn's continuing-conversation memo
+            existing_state.pop("_is_continuing", None)
             
             # Add new user image if provided (but don't overwrite existing)
             if user_image and not existing_state.get("user_image"):
@@ -187,6 +615,16 @@ class SessionManager:
                     "image": user_image
                 })
                 logger.info(f"➕ Added new user message to session {session_id}")
+                
+                # Persist the user turn right away as a small delta (the full save happens after the workflow)
+                persisted = self._delta_base(existing_state)
+                if persisted is not None:
+                    self._save_delta(
+                        existing_state,
+                        self._serialize_state(existing_state),
+                        persisted,
+                        keys=["user_message", "last_update_time"]
+                    )
             else:
                 logger.warning(f"⚠️ Duplicate user message detected for session {session_id}, skipping addition")
                 logger.warning(f"   Message: '{user_message[:50]}...'")
@@ -203,6 +641,9 @@ class SessionManager:
             new_state = create_initial_state(session_id, user_message, user_image, context)
             # Save the new state immediately so session existence checks work
             self.save_state(new_state)
+            # The caller keeps working on new_state, so it must not stay in the cache
+            with self._lock:
+                self._cache.pop(session_id, None)
             return new_state
     
     def deduplicate_messages(self, state: WorkflowState) -> WorkflowState:
@@ -253,21 +694,65 @@ class SessionManager:
         return state
     
     def _serialize_state(self, state: WorkflowState) -> Dict[str, Any]:
-        """Convert WorkflowState to JSON-serializable format"""
-        serialized = {}
+        """
+        Convert WorkflowState to JSON-serializable format (datetimes are encoded by dumps)
         
-        for key, value in state.items():
-            if isinstance(value, datetime):
-                serialized[key] = value.isoformat()
-            else:
-                serialized[key] = value
-                
-        return serialized
+        A large user_image is written once to a sidecar file and replaced by a reference (also in
+        the messages that carry it), so later snapshots and deltas don't carry the image again.
+        """
+        image = state.get("user_image")
+        if not isinstance(image, str) or len(image) < IMAGE_SIDECAR_MIN_CHARS:
+            return state
+        
+        session_id = state["session_id"]
+        stored = self._sidecar_images.get(session_id)
+        if stored is not None and (stored[0] is image or stored[0] == image):
+            file_name = stored[1]
+        else:
+            file_name = self._image_file_name(session_id, image)
+            image_file = os.path.join(self.storage_dir, file_name)
+            if not os.path.exists(image_file):
+                # Written synchronously so the sidecar is on disk before any snapshot referring to it
+                self._replace_file(image_file, image.encode("utf-8"))
+            self._sidecar_images[session_id] = (image, file_name)
+        
+        ref = {"__ref__": file_name}
+        messages = [
+            {**message, "image": ref} if message.get("image") == image else message
+            for message in state.get("messages", [])
+        ]
+        return {**state, "user_image": ref, "messages": messages}
     
     def _deserialize_state(self, data: Dict[str, Any]) -> WorkflowState:
         """Convert JSON data back to WorkflowState"""
         state = data.copy()
         
+        # Load images stored out of band in sidecar files (each file is read once)
+        images: Dict[str, Optional[str]] = {}
+        
+        def resolve(ref: Dict[str, str]) -> Optional[str]:
+            file_name = ref["__ref__"]
+            if file_name not in images:
+                image_file = os.path.join(self.storage_dir, file_name)
+                try:
+                    with open(image_file, 'r', encoding='utf-8') as f:
+                        images[file_name] = f.read()
+                except FileNotFoundError:
+                    logger.warning(f"⚠️ Image sidecar {image_file} is missing, dropping image")
+                    images[file_name] = None
+            return images[file_name]
+        
+        ref = state.get("user_image")
+        if isinstance(ref, dict) and "__ref__" in ref:
+            state["user_image"] = resolve(ref)
+            if state["user_image"] is not None:
+                self._sidecar_images[state["session_id"]] = (state["user_image"], ref["__ref__"])
+        
+        for message in state.get("messages", []):
+            image = message.get("image")
+            if isinstance(image, dict) and "__ref__" in image:
+                message["image"] = resolve(image)
+        
         # Convert datetime strings back to datetime objects
         for key in ["workflow_start_time", "last_update_time"]:
             if key in state and isinstance(state[key], str):
@@ -281,17 +766,32 @@ class SessionManager:
     def cleanup_expired_sessions(self) -> None:
         """Remove expired session files"""
         try:
-            current_time = datetime.now()
+            self.flush()
+            cutoff = time.time() - EXPIRY_SECONDS
             removed_count = 0
             
-            for filename in os.listdir(self.storage_dir):
-                if filename.endswith('.json'):
-                    file_path = os.path.join(self.storage_dir, filename)
-                    file_age = current_time - datetime.fromtimestamp(os.path.getmtime(file_path))
-                    
-                    if file_age > timedelta(hours=24):
-                        os.remove(file_path)
-                        removed_count += 1
+            # A session is as fresh as the newest of its files; scandir
+            # entries carry their stat info, so this is one directory pass
+            last_write: Dict[str, float] = {}
+            with os.scandir(self.storage_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(('.json', '.jsonl', '.img')):
+                        continue
+                    if entry.name.endswith('.img'):
+                        match = _IMAGE_SIDECAR_RE.fullmatch(entry.name)
+                        if match is None:
+                            continue
+                        session_id = match.group(1)
+                    else:
+                        session_id = os.path.splitext(entry.name)[0]
+                    mtime = entry.stat().st_mtime
+                    if mtime > last_write.get(session_id, 0.0):
+                        last_write[session_id] = mtime
+            
+            for session_id, mtime in last_write.items():
+                if mtime < cutoff:
+                    self._remove_session_files(session_id)
+                    removed_count += 1
             
             if removed_count > 0:
                 logger.info(f"🧹 Cleaned up {removed_count} expired sessions")
@@ -65,6 +65,7 @@ class WorkflowState(TypedDict):
     next_action: NotRequired[Optional[str]]
     requires_user_input: NotRequired[bool]
     is_complete: NotRequired[bool]
+    _is_continuing: NotRequired[bool]  # Per-turn memo of InitialNode's continuing-conversation check
     
     # Session Lifecycle
     session_ended: NotRequired[bool]
@@ -116,7 +116,7 @@ Examples:
         "--workers", 
         type=int, 
         default=1, 
-        help="Number of worker processes (default: 1)"
+        help="Number of worker processes (default: 1; session state is kept per process)"
     )
     parser.add_argument(
         "--check-env", 
@@ -155,11 +155,9 @@ Examples:
         server_config = {
             "log_level": args.log_level,
             "reload": args.reload,
+            "workers": args.workers,
         }
         
-        if args.workers > 1:
-            server_config["workers"] = args.workers
-        
         print(f"🌐 Server starting at http://{args.host}:{args.port}")
         print("📡 API endpoints:")
         print(f"   Health Check: http://{args.host}:{args.port}/health")
@@ -5,34 +5,35 @@ This module provides a FastAPI server interface for the FSM-based planning agent
 """
 
 import asyncio
-import json
 import logging
-from typing import Dict, Any, Optional
+from typing import AsyncIterator, Dict, Any, Optional, Union
 from datetime import datetime
 import os
+import importlib.util
 from contextlib import asynccontextmanager
 
-# Custom JSON encoder to handle datetime objects
-class CustomJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
-
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 import uvicorn
 from dotenv import load_dotenv
 
 from fsm_agent.core.fsm_agent import DynamicPlanningAgent
+from fsm_agent.core._json_utils import dumps
 
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Streamed events arriving within this window (seconds) are sent as one chunk, up to this size
+STREAM_COALESCE_SECONDS = 0.025
+STREAM_COALESCE_BYTES = 8 * 1024
+# Events buffered ahead of the client; a full buffer pauses the event generator (backpressure)
+STREAM_BUFFER_EVENTS = 64
+
 # Global agent instance
 agent: Optional[DynamicPlanningAgent] = None
 
@@ -61,6 +62,8 @@ async def lifespan(app: FastAPI):
     # Cleanup on shutdown
     if agent:
         logger.info("Shutting down Dynamic Planning Agent")
+        # Make sure queued session writes reach disk before the process exits
+        agent.workflow.session_manager.flush()
 
 
 # Create FastAPI app with lifespan manager
@@ -91,6 +94,25 @@ class ChatRequest(BaseModel):
     context: Optional[Dict[str, Any]] = Field(None, description="Additional context")
 
 
+# Chat bodies carry multi-megabyte base64 images, so the chat endpoints read the raw body and
+# let pydantic-core parse and validate it in one pass; this keeps the request schema in the docs
+_CHAT_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": ChatRequest.model_json_schema()}},
+    }
+}
+
+
+async def _parse_chat_request(raw_request: Request) -> ChatRequest:
+    """Validate a ChatRequest straight from the JSON body bytes"""
+    try:
+        return ChatRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        # Same error shape FastAPI produces for a declared body parameter
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+
+
 class ChatResponse(BaseModel):
     """Response model for chat endpoints"""
     success: bool
@@ -128,6 +150,65 @@ class AgentStatsResponse(BaseModel):
     uptime_seconds: float
 
 
+def _sse_event(event: str, data: Any) -> bytes:
+    """Format a server-sent event with a JSON payload (datetimes become ISO strings)"""
+    return b"event: " + event.encode("utf-8") + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+async def _coalesce_stream(stream: AsyncIterator[Union[str, bytes]],
+                           window: float = STREAM_COALESCE_SECONDS,
+                           max_bytes: int = STREAM_COALESCE_BYTES) -> AsyncIterator[bytes]:
+    """
+    Merge events that arrive close together into fewer, larger response chunks
+    
+    Events are never split, and a lone event waits at most `window` seconds before it is sent.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_EVENTS)
+    done = object()
+    
+    async def pump():
+        try:
+            async for chunk in stream:
+                await queue.put(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            await queue.put(done)
+            raise
+        await queue.put(done)
+    
+    loop = asyncio.get_running_loop()
+    task = asyncio.create_task(pump())
+    try:
+        finished = False
+        while not finished:
+            chunk = await queue.get()
+            if chunk is done:
+                break
+            
+            buf = bytearray(chunk)
+            deadline = loop.time() + window
+            while len(buf) < max_bytes:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if chunk is done:
+                    finished = True
+                    break
+                buf += chunk
+            
+            yield bytes(buf)
+        
+        # Surface errors raised by the underlying stream
+        await task
+    finally:
+        task.cancel()
+
+
 # ==================== API ENDPOINTS ====================
 
 @app.get("/")
@@ -153,11 +234,12 @@ async def health_check():
     }
 
 
-@app.post("/sasya-chikitsa/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.post("/sasya-chikitsa/chat", response_model=ChatResponse, openapi_extra=_CHAT_REQUEST_OPENAPI)
+async def chat(raw_request: Request):
     """
     Process a chat message (non-streaming)
     """
+    request = await _parse_chat_request(raw_request)
     if not agent:
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
@@ -202,11 +284,12 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/sasya-chikitsa/chat-stream")
-async def chat_stream(request: ChatRequest):
+@app.post("/sasya-chikitsa/chat-stream", openapi_extra=_CHAT_REQUEST_OPENAPI)
+async def chat_stream(raw_request: Request):
     """
     Process a chat message with streaming response
     """
+    request = await _parse_chat_request(raw_request)
     if not agent:
         raise HTTPException(status_code=503, detail="Agent not initialized")
     
@@ -228,25 +311,25 @@ async def chat_stream(request: ChatRequest):
                         # Stream clean state updates (metadata, progress, etc.)
                         state_data = chunk.get("data", {})
                         if isinstance(state_data, dict) and state_data:
-                            yield f"event: state_update\ndata: {json.dumps(state_data, cls=CustomJSONEncoder)}\n\n"
+                            yield _sse_event("state_update", state_data)
                     
                     elif chunk_type == "assistant_response":
                         # FIXED: Stream dedicated assistant responses (final answers for users)
                         response_data = chunk.get("data", {})
                         if isinstance(response_data, dict) and response_data:
-                            yield f"event: assistant_response\ndata: {json.dumps(response_data, cls=CustomJSONEncoder)}\n\n"
+                            yield _sse_event("assistant_response", response_data)
                     
                     elif chunk_type == "attention_overlay":
                         # Stream attention overlay visualization data
                         overlay_data = chunk.get("data", {})
                         if isinstance(overlay_data, dict) and overlay_data.get("attention_overlay"):
-                            yield f"event: attention_overlay\ndata: {json.dumps(overlay_data, cls=CustomJSONEncoder)}\n\n"
+                            yield _sse_event("attention_overlay", overlay_data)
                             logger.info(f"🎯 Streamed attention overlay for session {chunk.get('session_id')}")
                     
                     elif chunk_type == "error":
                         # Stream error
                         error = chunk.get("error", "Unknown error")
-                        yield f"event: error\ndata: {json.dumps({'error': error})}\n\n"
+                        yield _sse_event("error", {'error': error})
                         yield f"data: ❌ Error: {error}\n\n"
                         break
             else:
@@ -276,19 +359,19 @@ async def chat_stream(request: ChatRequest):
                         state_data = chunk.get("data", {})
                         if isinstance(state_data, dict) and state_data:
                             # Single clean state update - contains all necessary information
-                            yield f"event: state_update\ndata: {json.dumps(state_data, cls=CustomJSONEncoder)}\n\n"
+                            yield _sse_event("state_update", state_data)
                     
                     elif chunk_type == "attention_overlay":
                         # Stream attention overlay visualization data
                         overlay_data = chunk.get("data", {})
                         if isinstance(overlay_data, dict) and overlay_data.get("attention_overlay"):
-                            yield f"event: attention_overlay\ndata: {json.dumps(overlay_data, cls=CustomJSONEncoder)}\n\n"
+                            yield _sse_event("attention_overlay", overlay_data)
                             logger.info(f"🎯 Streamed attention overlay for new session {chunk.get('session_id')}")
                     
                     elif chunk_type == "error":
                         # Stream error
                         error = chunk.get("error", "Unknown error")
-                        yield f"event: error\ndata: {json.dumps({'error': error})}\n\n"
+                        yield _sse_event("error", {'error': error})
                         yield f"data: ❌ Error: {error}\n\n"
                         break
             
@@ -296,10 +379,10 @@ async def chat_stream(request: ChatRequest):
             
         except Exception as e:
             logger.error(f"Error in streaming: {str(e)}", exc_info=True)
-            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            yield _sse_event("error", {'error': str(e)})
     
     return StreamingResponse(
-        generate_stream(),
+        _coalesce_stream(generate_stream()),
         media_type="text/plain",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
@@ -482,6 +565,12 @@ class FSMServer:
             **kwargs
         }
         
+        # Prefer uvloop/httptools when installed (uvicorn[standard])
+        if "loop" not in config and importlib.util.find_spec("uvloop") is not None:
+            config["loop"] = "uvloop"
+        if "http" not in config and importlib.util.find_spec("httptools") is not None:
+            config["http"] = "httptools"
+        
         logger.info(f"Starting FSM server on {self.host}:{self.port}")
         
         # Use import string when reload or workers are specified to avoid warning
@@ -503,6 +592,8 @@ if __name__ == "__main__":
     parser.add_argument("--port", type=int, default=8002, help="Port to bind to")
     parser.add_argument("--log-level", default="info", help="Log level")
     parser.add_argument("--reload", action="store_true", help="Enable auto-reload")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1; session state is kept per process)")
     
     args = parser.parse_args()
     
@@ -516,5 +607,6 @@ if __name__ == "__main__":
     server = FSMServer(args.host, args.port)
     server.run(
         log_level=args.log_level,
-        reload=args.reload
+        reload=args.reload,
+        workers=args.workers
     )
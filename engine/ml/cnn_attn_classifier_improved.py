@@ -1,8 +1,11 @@
+import asyncio
 import base64
+import hashlib
 import numpy as np
 import cv2
 import os
-import time
+import threading
+from collections import OrderedDict
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive backend
 import matplotlib.pyplot as plt
@@ -25,6 +28,18 @@ MODEL_LABEL_CLASSES = [
 
 TARGET_IMG_SIZE = (64, 64)
 
+# Number of recent classification results kept per process, keyed by image content
+RESULT_CACHE_SIZE = 128
+
+# Shared across classifier instances; kept off the Keras layer so it isn't tracked as layer state
+_result_cache: "OrderedDict[bytes, dict]" = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+# (classifier model, attention model, and their compiled predict functions) loaded once per
+# process, see _get_shared_models()
+_shared_models = None
+_shared_models_lock = threading.Lock()
+
 # Define the custom layer needed for loading the model
 class ReshapeLayer(Layer):
     def __init__(self, target_shape, **kwargs):
@@ -45,8 +60,8 @@ class CNNWithAttentionClassifier(Layer):
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.loaded_model = CNNWithAttentionClassifier.load_model()
-        self.attention_model = CNNWithAttentionClassifier.create_attention_model(self.loaded_model)
+        (self.loaded_model, self.attention_model,
+         self._classify_fn, self._attention_fn) = _get_shared_models()
         print("[INFO] Model with attention visualization loaded successfully.")
 
     @staticmethod
@@ -103,7 +118,6 @@ class CNNWithAttentionClassifier(Layer):
         """
         try:
             yield "Generating attention visualization...\n"
-            time.sleep(0.5)
             
             # Prepare image for attention model
             processed_image = cv2.resize(image, target_size)
@@ -112,14 +126,13 @@ class CNNWithAttentionClassifier(Layer):
             
             # Get predictions and attention weights
             if self.attention_model:
-                predictions = self.attention_model.predict(processed_image)
+                predictions = self._attention_fn(processed_image)
                 
                 if isinstance(predictions, list) and len(predictions) > 1:
                     final_output = predictions[0]
                     attention_weights = predictions[1]
                     
                     yield "Processing attention weights...\n"
-                    time.sleep(0.3)
                     
                     # Process attention weights to create heatmap
                     sequence_length = attention_weights.shape[1]
@@ -155,7 +168,6 @@ class CNNWithAttentionClassifier(Layer):
                             normalized_attention = np.zeros_like(resized_attention)
                         
                         yield "Creating attention heatmap overlay...\n"
-                        time.sleep(0.3)
                         
                         # Create heatmap overlay
                         heatmap = cv2.applyColorMap(
@@ -226,6 +238,34 @@ class CNNWithAttentionClassifier(Layer):
         if image_bytes is None:
             return {"error": "Mandatory argument 'image_bytes' is missing"}
 
+        # The same upload is often classified more than once per conversation;
+        # reuse its prediction and overlay instead of decoding and running the models again
+        cache_key = self._image_cache_key(image_bytes)
+        with _result_cache_lock:
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                _result_cache.move_to_end(cache_key)
+        if cached is not None:
+            return {**cached, "input_context": input_text}
+
+        result = self._classify_image(image_bytes, input_text)
+        if result.get("success"):
+            with _result_cache_lock:
+                _result_cache[cache_key] = result
+                _result_cache.move_to_end(cache_key)
+                while len(_result_cache) > RESULT_CACHE_SIZE:
+                    _result_cache.popitem(last=False)
+        return dict(result)
+
+    @staticmethod
+    def _image_cache_key(image_bytes):
+        """Content hash of the (base64) image payload used as the result cache key."""
+        if isinstance(image_bytes, str):
+            image_bytes = image_bytes.encode("utf-8")
+        return hashlib.blake2b(image_bytes, digest_size=16).digest()
+
+    def _classify_image(self, image_bytes, input_text=""):
+        """Decode the base64 image, run the CNN and build the attention overlay."""
         try:
             # Clean the base64 string - remove whitespace and potential prefixes
             clean_image_bytes = image_bytes.strip()
@@ -261,7 +301,7 @@ class CNNWithAttentionClassifier(Layer):
             image_for_prediction = np.expand_dims(image_preprocessed, axis=0)
 
             # Run CNN model inference
-            prediction = self.loaded_model.predict(image_for_prediction)
+            prediction = self._classify_fn(image_for_prediction)
 
             # Get prediction results
             predicted_class_index = np.argmax(prediction)
@@ -307,7 +347,7 @@ class CNNWithAttentionClassifier(Layer):
             
             # Get predictions and attention weights
             if self.attention_model:
-                predictions = self.attention_model.predict(processed_image)
+                predictions = self._attention_fn(processed_image)
                 
                 if isinstance(predictions, list) and len(predictions) > 1:
                     attention_weights = predictions[1]
@@ -398,7 +438,33 @@ class CNNWithAttentionClassifier(Layer):
         Now uses the new complete method and yields the results.
         """
         result = self.predict_leaf_classification_complete(image_bytes, input_text)
-        
+        yield from self._result_chunks(result)
+
+    async def apredict_leaf_classification(self, image_bytes, input_text=""):
+        """
+        Async variant of predict_leaf_classification for use inside coroutines.
+
+        The blocking model inference runs in the default executor, so the event loop
+        keeps serving other requests while the image is classified.
+
+        Yields:
+            str: The same status and result chunks as predict_leaf_classification
+        """
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(
+            None, self.predict_leaf_classification_complete, image_bytes, input_text
+        )
+        for chunk in self._result_chunks(result):
+            yield chunk
+
+    @staticmethod
+    def _result_chunks(result):
+        """
+        Turn a predict_leaf_classification_complete result into streaming chunks.
+
+        Yields:
+            str: Status messages, the attention overlay and the final diagnosis
+        """
         if result.get("error"):
             yield f"Error: {result['error']}\n"
             return
@@ -419,4 +485,49 @@ class CNNWithAttentionClassifier(Layer):
             yield f"ATTENTION_OVERLAY_BASE64:{result['attention_overlay']}\n"
         
         yield f"Diagnosis Complete! Health Status: {result['disease_name']} with confidence {result['confidence']:.2f}\n"
-        return
\ No newline at end of file
+        return
+
+
+def _get_shared_models():
+    """Load the CNN and its attention model once per process and share them between classifier instances."""
+    global _shared_models
+    with _shared_models_lock:
+        if _shared_models is None:
+            loaded_model = CNNWithAttentionClassifier.load_model()
+            attention_model = CNNWithAttentionClassifier.create_attention_model(loaded_model)
+            _shared_models = (loaded_model, attention_model,
+                              _compile_single_image_predict(loaded_model),
+                              _compile_single_image_predict(attention_model))
+        return _shared_models
+
+
+def _compile_single_image_predict(model):
+    """
+    Trace the model once for a single (1, H, W, C) image and return a predict-like function.
+
+    Model.predict sets up a data pipeline on every call, which dominates the cost of
+    classifying one small image; the traced graph is warmed up here so the first request
+    doesn't pay for tracing. Inputs of any other shape fall back to Model.predict.
+    """
+    input_shape = (1,) + tuple(model.input_shape[1:])
+    if None in input_shape:
+        return model.predict
+
+    forward = tf.function(
+        lambda x: model(x, training=False),
+        input_signature=[tf.TensorSpec(input_shape, tf.float32)],
+    )
+
+    try:
+        forward(tf.zeros(input_shape, tf.float32))
+    except Exception as e:
+        print(f"[WARNING] Could not compile single-image inference, using Model.predict: {e}")
+        return model.predict
+
+    def predict(image_batch):
+        if image_batch.shape != input_shape:
+            return model.predict(image_batch)
+        outputs = forward(tf.constant(np.asarray(image_batch, dtype=np.float32)))
+        return tf.nest.map_structure(lambda t: t.numpy(), outputs)
+
+    return predict
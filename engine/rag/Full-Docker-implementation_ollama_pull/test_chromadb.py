@@ -1,6 +1,11 @@
+import functools
+import logging
+import os
+from typing import Dict, List
+
 import chromadb
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_chroma import Chroma
 from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
@@ -12,23 +17,59 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
 
 # Create the FastAPI app instance
 app = FastAPI()
 
+# One client for the whole process; its HTTP session keeps the connection to Chroma alive
 # chroma_client = chromadb.HttpClient(host='0.0.0.0', port=8000)
-chroma_client = chromadb.HttpClient(host="chroma-small", port=8000)
-
-print("ChromaDB heartbeat:", chroma_client.heartbeat())
-print("Available collections:", chroma_client.list_collections())
+chroma_client = chromadb.HttpClient(host=os.getenv("CHROMA_HOST", "chroma-small"), port=8000)
 
 print("ChromaDB client connected successfully.")
 
+# Collection handles by name; a successful get_collection() doubles as the readiness check
+collections: Dict[str, chromadb.Collection] = {}
+
+
+def get_collection(collection_name: str) -> chromadb.Collection:
+    """Return the Chroma collection handle, fetching it from the server on first use"""
+    collection = collections.get(collection_name)
+    if collection is None:
+        collection = chroma_client.get_collection(name=collection_name)
+        collections[collection_name] = collection
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Opened collection %s (%d documents)", collection_name, collection.count())
+    return collection
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes embed_query so repeated questions skip the model"""
+
+    def __init__(self, base: Embeddings, maxsize: int = 4096):
+        self.base = base
+        self._embed_query = functools.lru_cache(maxsize=maxsize)(self._embed_query_tuple)
+
+    def _embed_query_tuple(self, text: str):
+        return tuple(self.base.embed_query(text))
+
+    def embed_query(self, text: str) -> List[float]:
+        return list(self._embed_query(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+
 # using a small embedding here
-embedding = HuggingFaceEmbeddings(model_name="multi-qa-MiniLM-L6-cos-v1")
+embedding = CachedQueryEmbeddings(HuggingFaceEmbeddings(
+    model_name="multi-qa-MiniLM-L6-cos-v1",
+    encode_kwargs={"normalize_embeddings": True},
+))
 
 # Define LLM 
+llm = ChatOllama(model="llama3.1:8b", temperature=0.7, max_tokens=512, base_url="http://ollama-app:11434")
                 #   host="ollama-app", port=11434)
 
 # llm = ChatGroq(
@@ -56,42 +97,47 @@ ANSWER:
 """
 PROMPT = PromptTemplate(input_variables=["context", "question"], template=prompt_template)
 
-class Queryrequest(BaseModel):
+# RetrievalQA chains per collection, built on first use and reused across requests
+qa_chains: Dict[str, RetrievalQA] = {}
 
-    question:str
-    collections:str
-
-@app.post("/ask")
-def run_query(request:Queryrequest):
-
-    collection = chroma_client.get_collection(name=request.collections)
-
-    print("collections:", collection)
 
+def get_qa_chain(collection_name: str) -> RetrievalQA:
+    """Return the RetrievalQA chain for a collection, building it on first use"""
+    qa_chain = qa_chains.get(collection_name)
+    if qa_chain is not None:
+        return qa_chain
 
     chroma_db = Chroma(
         client=chroma_client,          # use the running client
-        collection_name="Apple",       # choose which collection to query
+        collection_name=collection_name,
         embedding_function=embedding
     )
 
-    retriever = chroma_db.as_retriever(search_type="mmr", search_kwargs={"k": 5, "fetch_k": 10})
-
-    llm = ChatOllama(model="llama3.1:8b", temperature=0.7, max_tokens=512, base_url="http://ollama-app:11434")
-
-    PROMPT = PromptTemplate(input_variables=["context", "question"], template=prompt_template)
+    # Plain similarity search: MMR makes Chroma ship back fetch_k embeddings per query
+    retriever = chroma_db.as_retriever(search_type="similarity", search_kwargs={"k": 5})
 
     qa_chain = RetrievalQA.from_chain_type(
         llm=llm,
         chain_type="stuff",
         retriever=retriever,
         chain_type_kwargs={"prompt": PROMPT},
-        return_source_documents=True
+        return_source_documents=False   # /ask only returns the answer text
     )
+    return qa_chains.setdefault(collection_name, qa_chain)
+
 
+class Queryrequest(BaseModel):
+
+    question:str
+    collections:str
+
+@app.post("/ask")
+def run_query(request:Queryrequest):
 
-    print("using llm",llm)
+    # Fails for unknown collections, so qa_chains only ever holds chains for real ones
+    collection = get_collection(request.collections)
 
+    qa_chain = get_qa_chain(collection.name)
 
     answer = qa_chain.invoke({"query": request.question})["result"]
 
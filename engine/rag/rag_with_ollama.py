@@ -1,16 +1,24 @@
-# import pandas as pd
 import chromadb
 from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import PromptTemplate
-from langchain.chains import RetrievalQA
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.chat_models import ChatOllama
-from fastapi import FastAPI
-from pydantic import BaseModel
-# import uvicorn
+import hashlib
 import os
+import re
 import logging
-from typing import Dict, List, Optional
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import torch
+except ImportError:
+    torch = None
 
 # Configure logging
 logging.basicConfig(
@@ -19,6 +27,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+class InferenceModeEmbeddings(HuggingFaceEmbeddings):
+    """HuggingFaceEmbeddings that encodes under torch.inference_mode() to skip autograd bookkeeping."""
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if torch is None:
+            return super().embed_documents(texts)
+        with torch.inference_mode():
+            return super().embed_documents(texts)
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings adapter that coalesces concurrent embed_query calls into one batched forward pass.
+    
+    Queries arriving within a short window (e.g. from several sessions hitting different plant
+    collections at once) are encoded together with a single embed_documents call on the wrapped
+    model. HuggingFaceEmbeddings.embed_query is embed_documents([text])[0], so results are identical.
+    """
+    
+    def __init__(self, embedding: Embeddings, max_batch_size: int = 8, batch_window: float = 0.01):
+        """
+        Args:
+            embedding: Underlying embedding model
+            max_batch_size: Maximum number of queries encoded together
+            batch_window: Seconds to wait for more queries after the first one arrives
+        """
+        self.embedding = embedding
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Document batches are already batched; pass them straight through."""
+        return self.embedding.embed_documents(texts)
+    
+    def embed_query(self, text: str) -> List[float]:
+        """Queue the query for the next batch and wait for its embedding."""
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+    
+    def _run(self):
+        """Background loop: collect up to max_batch_size queries or until the window closes, then encode."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                vectors = self.embedding.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                logger.error(f"❌ Batched query embedding failed for {len(batch)} queries: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
 class OllamaRag:
     """
     Enhanced RAG system with pre-initialized ChromaDB collections for multiple plant types.
@@ -47,9 +124,21 @@ class OllamaRag:
         'garlic': 'Garlic'
     }
     
+    # Single alternation over all plant keywords (longest first, so plurals win over their stem)
+    _PLANT_RE = re.compile(
+        r'\b(' + '|'.join(map(re.escape, sorted(SUPPORTED_PLANT_TYPES, key=len, reverse=True))) + r')\b',
+        re.IGNORECASE
+    )
+    
     # Default collections to initialize (most common plant types)
     DEFAULT_COLLECTIONS = ['Tomato', 'Potato', 'Rice', 'Wheat', 'Corn']
     
+    # Number of recent answers kept in memory
+    ANSWER_CACHE_SIZE = 512
+    
+    # Seconds a collection that failed to open is skipped before the next attempt
+    COLLECTION_RETRY_SECONDS = 30.0
+    
     # Creating the Prompt Template
     prompt_template = """
         You are an agricultural assistant specialized in answering questions about plant diseases.  
@@ -78,6 +167,12 @@ class OllamaRag:
 
         OUTPUT:
         """
+    
+    # Static pieces of the prompt around {context} and {question}, split once so run_query
+    # only concatenates instead of re-running template formatting per query
+    _PROMPT_PREFIX, _rest = prompt_template.split("{context}")
+    _PROMPT_MIDDLE, _PROMPT_SUFFIX = _rest.split("{question}")
+    del _rest
 
     def __init__(self, 
                  llm_name: str, 
@@ -110,24 +205,37 @@ class OllamaRag:
         
         # Initialize embeddings (shared across all collections)
         logger.info(f"📚 Initializing embeddings with model: {embedding_model}")
-        self.embedding = HuggingFaceEmbeddings(model_name=embedding_model)
+        # Concurrent queries share one forward pass through the batching adapter
+        self.embedding = BatchingEmbeddings(self._create_embeddings(embedding_model))
         self.persist_directory = persist_directory
         
-        # Determine which collections to initialize
+        # One ChromaDB client shared by every collection, so the store is opened once
+        # if using the docker container, client must be considered if you are running container in port 8000
+        self.chroma_client = chromadb.HttpClient(host="localhost", port=8000)
+        
+        # Determine which collections to serve
         self.collections_to_init = collections_to_init or self.DEFAULT_COLLECTIONS
-        logger.info(f"🗂️  Initializing collections: {self.collections_to_init}")
+        logger.info(f"🗂️  Serving collections: {self.collections_to_init}")
         
-        # Pre-initialize all ChromaDB collections and retrievers
+        # ChromaDB collections, opened on first use; run_query searches them directly
         self.chroma_databases: Dict[str, Chroma] = {}
-        self.retrievers: Dict[str, RetrievalQA] = {}
-        self._initialize_all_collections()
+        self._init_lock = threading.Lock()
+        # time.monotonic() of each collection's last failed open, so queries don't retry it every time
+        self._failed_collections: Dict[str, float] = {}
+        
+        # LRU of generated answers; repeated questions skip retrieval and the LLM call
+        self._answer_cache: OrderedDict[Tuple[str, bytes], str] = OrderedDict()
+        self._answer_cache_lock = threading.Lock()
         
         # Set default collection (fallback)
         self.default_collection = self.collections_to_init[0] if self.collections_to_init else 'Tomato'
         
+        # Open collections up front until one succeeds, so a broken setup still fails fast
+        if not any(self._get_collection(name) is not None for name in self.collections_to_init):
+            raise RuntimeError("Failed to initialize any ChromaDB collections!")
+        
         logger.info("✅ Enhanced RAG system initialization completed!")
-        logger.info(f"   📊 Loaded {len(self.chroma_databases)} collections")
-        logger.info(f"   🔍 Configured {len(self.retrievers)} retrievers")
+        logger.info(f"   📊 Loaded {len(self.chroma_databases)} collections (others open on first use)")
         logger.info(f"   🎯 Default collection: {self.default_collection}")
 
     def _initialize_llm(self, llm_name: str, temperature: float):
@@ -150,57 +258,89 @@ class OllamaRag:
                 "No chat model configured. Set OLLAMA_HOST (and optionally OLLAMA_MODEL) or run Ollama and set OLLAMA_MODEL."
             )
 
-    def _initialize_all_collections(self):
-        """Pre-initialize ChromaDB and retrievers for all specified collections."""
-        successful_collections = []
-
-        # if using the docker container, client must be considered if you are running container in port 8000
-        chroma_client = chromadb.HttpClient(host="localhost", port=8000)
-
-        for collection_name in self.collections_to_init:
+    def _create_embeddings(self, embedding_model: str) -> HuggingFaceEmbeddings:
+        """Load the encoder on CUDA when a GPU is available (optionally bfloat16), on CPU (optionally int8) otherwise."""
+        model_kwargs = {"trust_remote_code": False}
+        if torch is not None and torch.cuda.is_available():
+            model_kwargs["device"] = "cuda"
+            # Opt-in: bfloat16 weights halve GPU memory and speed up encoding, but like int8 below the
+            # query vectors drift slightly from the fp32 vectors the collections were indexed with
+            if os.getenv("RAG_EMBEDDING_BF16", "").lower() in ("1", "true", "yes"):
+                model_kwargs["model_kwargs"] = {"torch_dtype": torch.bfloat16}
+                logger.info("⚡ Loading embedding encoder in bfloat16 on CUDA (RAG_EMBEDDING_BF16)")
+        else:
+            model_kwargs["device"] = "cpu"
+        logger.debug(f"Embedding model kwargs: {model_kwargs}")
+        
+        embeddings = InferenceModeEmbeddings(
+            model_name=embedding_model,
+            model_kwargs=model_kwargs,
+            encode_kwargs={"batch_size": 64},
+        )
+        
+        # Opt-in: dynamic int8 quantization of the Linear layers roughly halves CPU encode time for
+        # the large e5 encoder, but query vectors drift slightly from the fp32 vectors the
+        # collections were indexed with, so top-k results can differ from the fp32 encoder
+        if (torch is not None and model_kwargs["device"] == "cpu"
+                and os.getenv("RAG_EMBEDDING_INT8", "").lower() in ("1", "true", "yes")):
             try:
-                logger.info(f"🔧 Initializing collection: {collection_name}")
-                
-                # Initialize ChromaDB for this collection
-                chroma_db = Chroma(
-                    client = chroma_client,
-                    # persist_directory=self.persist_directory,
-                    embedding_function=self.embedding,
-                    collection_name=collection_name,
-
-                )
-                
-                # Create retriever for this collection
-                chroma_retriever = chroma_db.as_retriever(
-                    search_type="mmr", 
-                    search_kwargs={"k": 6, "fetch_k": 12}
+                # Quantize a copy so a failure part-way leaves the fp32 encoder untouched
+                embeddings.client = torch.ao.quantization.quantize_dynamic(
+                    embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
                 )
-                
-                # Create RetrievalQA chain for this collection
-                retrieval_qa = RetrievalQA.from_chain_type(
-                    llm=self.llm,
-                    chain_type="stuff",
-                    retriever=chroma_retriever,
-                    input_key="query",
-                    return_source_documents=True,
-                    chain_type_kwargs=self.chain_type_kwargs,
-                )
-                
-                # Store in dictionaries
-                self.chroma_databases[collection_name] = chroma_db
-                self.retrievers[collection_name] = retrieval_qa
-                successful_collections.append(collection_name)
-                
-                logger.info(f"✅ Successfully initialized collection: {collection_name}")
-                
+                logger.info("🗜️  Quantized embedding encoder to int8 for CPU inference (RAG_EMBEDDING_INT8)")
+            except Exception as e:
+                logger.warning(f"⚠️  int8 quantization unavailable, using fp32 encoder: {e}")
+        
+        return embeddings
+
+    def _get_collection(self, collection_name: str) -> Optional[Chroma]:
+        """
+        Return the ChromaDB handle for a collection, initializing it on first use.
+        
+        Returns:
+            The Chroma instance, or None if the collection could not be initialized (or failed
+            less than COLLECTION_RETRY_SECONDS ago)
+        """
+        chroma_db = self.chroma_databases.get(collection_name)
+        if chroma_db is not None:
+            return chroma_db
+        
+        failed_at = self._failed_collections.get(collection_name)
+        if failed_at is not None and time.monotonic() - failed_at < self.COLLECTION_RETRY_SECONDS:
+            return None
+        
+        with self._init_lock:
+            # Another thread may have initialized it while we waited for the lock
+            chroma_db = self.chroma_databases.get(collection_name)
+            if chroma_db is not None:
+                return chroma_db
+            
+            try:
+                chroma_db = self._initialize_collection(collection_name)
             except Exception as e:
                 logger.error(f"❌ Failed to initialize collection {collection_name}: {e}")
-                continue
+                self._failed_collections[collection_name] = time.monotonic()
+                return None
+            self._failed_collections.pop(collection_name, None)
+            return chroma_db
+
+    def _initialize_collection(self, collection_name: str) -> Chroma:
+        """Initialize ChromaDB for a single collection."""
+        logger.info(f"🔧 Initializing collection: {collection_name}")
         
-        if not successful_collections:
-            raise RuntimeError("Failed to initialize any ChromaDB collections!")
+        # Initialize ChromaDB for this collection
+        chroma_db = Chroma(
+            client = self.chroma_client,
+            # persist_directory=self.persist_directory,
+            embedding_function=self.embedding,
+            collection_name=collection_name,
+
+        )
+        self.chroma_databases[collection_name] = chroma_db
         
-        logger.info(f"🎉 Successfully initialized {len(successful_collections)} collections")
+        logger.info(f"✅ Successfully initialized collection: {collection_name}")
+        return chroma_db
         
     def _detect_plant_type(self, query: str) -> str:
         """
@@ -212,16 +352,15 @@ class OllamaRag:
         Returns:
             ChromaDB collection name for the detected plant type
         """
-        query_lower = query.lower()
-        
-        # Check for plant type keywords in query
-        for plant_keyword, collection_name in self.SUPPORTED_PLANT_TYPES.items():
-            if plant_keyword in query_lower:
-                if collection_name in self.chroma_databases:
-                    logger.debug(f"🎯 Detected plant type: {plant_keyword} → collection: {collection_name}")
-                    return collection_name
-                else:
-                    logger.debug(f"⚠️  Plant type detected ({plant_keyword}) but collection not available: {collection_name}")
+        # Check plant type keywords in the order they appear in the query
+        for match in self._PLANT_RE.finditer(query):
+            plant_keyword = match.group(1).lower()
+            collection_name = self.SUPPORTED_PLANT_TYPES[plant_keyword]
+            if collection_name in self.collections_to_init:
+                logger.debug(f"🎯 Detected plant type: {plant_keyword} → collection: {collection_name}")
+                return collection_name
+            else:
+                logger.debug(f"⚠️  Plant type detected ({plant_keyword}) but collection not available: {collection_name}")
         
         # Fallback to default collection
         logger.debug(f"🔄 No specific plant type detected, using default: {self.default_collection}")
@@ -291,6 +430,19 @@ class OllamaRag:
         # Multiple conditions: wrap in $and operator
         return {"$and": conditions}
 
+    def _format_prompt(self, context: str, question: str) -> str:
+        """Render the QA prompt; equivalent to self.PROMPT.format(context=..., question=...)."""
+        return "".join((self._PROMPT_PREFIX, context, self._PROMPT_MIDDLE, question, self._PROMPT_SUFFIX))
+
+    @staticmethod
+    def _answer_cache_key(collection_name: str, query_request: str, season: Optional[str],
+                          location: Optional[str], disease: Optional[str]) -> Tuple[str, bytes]:
+        """Cache key for an answer: collection plus a fixed-size digest of the normalized query and filters."""
+        normalized = "\x1f".join(
+            (value or "").strip().lower() for value in (query_request, season, location, disease)
+        )
+        return collection_name, hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
     def run_query(self, 
                   query_request: str, 
                   plant_type: Optional[str] = None,
@@ -312,18 +464,20 @@ class OllamaRag:
         """
         try:
             # Determine which collection to use
-            if plant_type and plant_type in self.chroma_databases:
+            if plant_type and plant_type in self.collections_to_init:
                 collection_name = plant_type
                 logger.debug(f"🎯 Using explicit plant type: {plant_type}")
             else:
                 collection_name = self._detect_plant_type(query_request)
             
-            # Get the appropriate ChromaDB instance (not retriever)
-            if collection_name not in self.chroma_databases:
+            # Get the appropriate ChromaDB instance (not retriever), opening it on first use
+            chroma_db = self._get_collection(collection_name)
+            if chroma_db is None:
                 logger.warning(f"⚠️  Collection {collection_name} not available, falling back to {self.default_collection}")
                 collection_name = self.default_collection
-            
-            chroma_db = self.chroma_databases[collection_name]
+                chroma_db = self._get_collection(collection_name)
+                if chroma_db is None:
+                    raise RuntimeError(f"Default collection {collection_name} not available")
             logger.debug(f"🔍 Querying collection: {collection_name}")
             
             # Build metadata filter
@@ -331,6 +485,15 @@ class OllamaRag:
             if metadata_filter:
                 logger.info(f"🎯 Using metadata filters: {metadata_filter}")
             
+            cache_key = self._answer_cache_key(collection_name, query_request, season, location, disease)
+            with self._answer_cache_lock:
+                cached_answer = self._answer_cache.get(cache_key)
+                if cached_answer is not None:
+                    self._answer_cache.move_to_end(cache_key)
+            if cached_answer is not None:
+                logger.info(f"⚡ Returning cached answer for collection: {collection_name}")
+                return cached_answer
+            
             # Execute search with metadata filtering
             if metadata_filter:
                 # Use ChromaDB directly with metadata filtering
@@ -354,11 +517,17 @@ class OllamaRag:
             context = "\n\n".join([doc.page_content for doc in docs])
             
             # Generate answer using LLM with context
-            formatted_prompt = self.PROMPT.format(context=context, question=query_request)
+            formatted_prompt = self._format_prompt(context, query_request)
             answer = self.llm.invoke(formatted_prompt).content
             
             logger.info(f"✅ Query completed successfully using collection: {collection_name} with {len(docs)} documents")
             
+            with self._answer_cache_lock:
+                self._answer_cache[cache_key] = answer
+                self._answer_cache.move_to_end(cache_key)
+                if len(self._answer_cache) > self.ANSWER_CACHE_SIZE:
+                    self._answer_cache.popitem(last=False)
+            
             return answer
             
         except Exception as e:
@@ -366,12 +535,14 @@ class OllamaRag:
             # Try fallback to default collection without metadata filtering
             logger.info(f"🔄 Attempting fallback to default collection without metadata filters...")
             try:
-                fallback_db = self.chroma_databases[self.default_collection]
+                fallback_db = self._get_collection(self.default_collection)
+                if fallback_db is None:
+                    raise RuntimeError(f"Default collection {self.default_collection} not available")
                 docs = fallback_db.similarity_search(query_request, k=6)
                 
                 if docs:
                     context = "\n\n".join([doc.page_content for doc in docs])
-                    formatted_prompt = self.PROMPT.format(context=context, question=query_request)
+                    formatted_prompt = self._format_prompt(context, query_request)
                     answer = self.llm.invoke(formatted_prompt).content
                     logger.info("✅ Fallback query completed successfully")
                     return answer
@@ -384,20 +555,21 @@ class OllamaRag:
             raise RuntimeError(f"RAG query failed: {e}")
 
     def get_available_collections(self) -> List[str]:
-        """Get list of successfully initialized collections."""
-        return list(self.chroma_databases.keys())
+        """Get list of served collections (non-default ones are opened on first use)."""
+        return list(self.collections_to_init)
     
     def get_collection_info(self) -> Dict[str, Dict]:
-        """Get information about all initialized collections."""
+        """Get information about all served collections."""
         info = {}
-        for collection_name, chroma_db in self.chroma_databases.items():
+        for collection_name in self.collections_to_init:
             try:
                 # Try to get basic collection info
                 info[collection_name] = {
                     "collection_name": collection_name,
                     "persist_directory": self.persist_directory,
-                    "status": "initialized",
-                    "has_retriever": collection_name in self.retrievers
+                    "status": "initialized" if collection_name in self.chroma_databases else "not_loaded",
+                    # run_query searches the Chroma handle directly; no separate retriever is built
+                    "has_retriever": collection_name in self.chroma_databases
                 }
             except Exception as e:
                 info[collection_name] = {
@@ -410,7 +582,7 @@ class OllamaRag:
 # Example usage:
 # if __name__ == "__main__":
 #     # Initialize with default collections
-#     rag_system = ollama_rag(llm_name="llama-3.1:8b", temperature=0.1)
+#     rag_system = OllamaRag(llm_name="llama3.1:8b", temperature=0.1)
 #     
 #     # Query with automatic plant type detection
 #     response = rag_system.run_query("What are common diseases in tomatoes?")